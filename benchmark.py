@@ -0,0 +1,161 @@
+import argparse
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+import timeit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mppt_bus import BusScheduler
+from mppt_decoder import UNITS, decode_frame, parse_response, validate_checksum
+from mppt_publisher import HomeAssistantPublisher
+from mppt_simulator import SAMPLE_FRAME, Simulator, SimulatedPort
+
+CHARGER_COUNTS = (1, 2, 8, 32)
+
+
+# p50/p95/p99 of a list of samples, in the samples' unit
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None}
+    return {name: samples[int(fraction * (len(samples) - 1))]
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))}
+
+
+# Best-of-`repeat` microseconds per call
+def microbenchmark(function, number=20000, repeat=5):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+
+class _MockHomeAssistant(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        # Send headers and body in one write to avoid delayed-ACK stalls
+        self._headers_buffer.append(b'\r\n{}')
+        self.flush_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local stand-in for the Home Assistant REST API
+def start_mock_home_assistant():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _MockHomeAssistant)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _TimedScheduler(BusScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.poll_latencies = []
+
+    def poll(self, address):
+        start_time = time.perf_counter()
+        try:
+            return super().poll(address)
+        finally:
+            self.poll_latencies.append(time.perf_counter() - start_time)
+
+
+def _ha_states(data, entity_prefix):
+    return {
+        f"sensor.{entity_prefix}_{key}": {
+            'state': value,
+            'attributes': {'unit_of_measurement': UNITS.get(key, ''), 'friendly_name': key},
+        }
+        for key, value in zip(data._fields, data)
+    }
+
+
+def bench_decode():
+    return {
+        'parse_response_us': microbenchmark(lambda: parse_response(SAMPLE_FRAME)),
+        'decode_frame_us': microbenchmark(lambda: decode_frame(SAMPLE_FRAME)),
+        'validate_checksum_us': microbenchmark(lambda: validate_checksum(SAMPLE_FRAME)),
+    }
+
+
+# Poll `chargers` simulated chargers for `duration` seconds and publish every
+# cycle to the mock Home Assistant
+def bench_cycle(chargers, duration, baud_rate, pace, ha_url):
+    simulator = Simulator(range(1, chargers + 1), baud_rate=baud_rate, seed=0)
+    port = SimulatedPort(simulator, timeout=0.5, pace=pace)
+    publisher = HomeAssistantPublisher(ha_url, 'benchmark')
+    publish_latencies = []
+
+    def publish(cycle):
+        start_time = time.perf_counter()
+        states = {}
+        for address, data in cycle.items():
+            states.update(_ha_states(data, f'mppt_{address}'))
+        publisher.publish(states)
+        publish_latencies.append(time.perf_counter() - start_time)
+
+    scheduler = _TimedScheduler(port, simulator.chargers, baud_rate, publish, timeout=0.5)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    time.sleep(duration)
+    scheduler.stop()
+    thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    stats = publisher.stats()
+    publisher.close()
+
+    return {
+        'chargers': chargers,
+        'seconds': wall,
+        'frames_per_second': sum(scheduler.samples.values()) / wall,
+        'failures': sum(scheduler.failures.values()),
+        'poll_latency_s': percentiles(scheduler.poll_latencies),
+        'cycle_publish_latency_s': percentiles(publish_latencies),
+        'publishes_per_second': stats['requests'] / wall,
+        'publish_failures': stats['failures'],
+        'ha_request_latency_s': {name: stats[name] for name in ('p50', 'p95', 'p99')},
+        'cpu_percent': 100 * cpu / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark decoding, polling and publishing.')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per end-to-end run')
+    parser.add_argument('--chargers', type=int, nargs='+', default=CHARGER_COUNTS, help='Charger counts to run')
+    parser.add_argument('--baud', type=int, default=9600, help='Simulated baud rate')
+    parser.add_argument('--no-pace', action='store_true', help='Do not pace replies at the baud rate')
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    server = start_mock_home_assistant()
+    ha_url = f'http://127.0.0.1:{server.server_port}'
+
+    results = {
+        'python': sys.version.split()[0],
+        'decode': bench_decode(),
+        'cycles': [bench_cycle(count, args.duration, args.baud, not args.no_pace, ha_url)
+                   for count in args.chargers],
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    server.shutdown()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from mppt_decoder import CHARGING_FAULT_MASK, CHARGING_STATUS_BITS, OPERATING_FAULT_MASK, status_mask
+
+# Charging status bits, tested on the raw status byte
+_CHARGING = status_mask(CHARGING_STATUS_BITS, 'charging')
+_FLOATING_CHARGE = status_mask(CHARGING_STATUS_BITS, 'floating_charge')
+
+
+# Adaptive polling policy: decides how long to wait before polling a charger
+# again based on its last reading, so volatile daytime chargers are polled
+# quickly while idle ones at night or in steady float charge back off.
+class AdaptivePolicy:
+    def __init__(self, fast=1.0, normal=5.0, steady=15.0, night=60.0, failure=5.0,
+                 night_pv_voltage=5.0, volatility=0.05):
+        self.fast = fast
+        self.normal = normal
+        self.steady = steady
+        self.night = night
+        self.failure = failure
+        self.night_pv_voltage = night_pv_voltage
+        self.volatility = volatility
+        self.last_power = {}
+
+    # Seconds until `address` should be polled again after reading `data`
+    # (a decoded Reading)
+    def interval(self, address, data):
+        power = data.charging_current * data.battery_voltage
+        previous = self.last_power.get(address)
+        self.last_power[address] = power
+
+        # Any fault bit (as reported by mppt_faults) keeps the charger on the fast path
+        if data.operating_status & OPERATING_FAULT_MASK or data.charging_status & CHARGING_FAULT_MASK:
+            return self.fast
+
+        charging = data.charging_status & _CHARGING
+        if not charging and data.pv_voltage_in < self.night_pv_voltage:
+            return self.night
+
+        if previous is not None:
+            change = abs(power - previous) / max(previous, 1.0)
+            if change >= self.volatility:
+                return self.fast
+
+        if data.charging_status & _FLOATING_CHARGE or not charging:
+            return self.steady
+        return self.normal
+
+    # Seconds until `address` should be retried after a failed query
+    def failed(self, address):
+        self.last_power.pop(address, None)
+        return self.failure
@@ -0,0 +1,229 @@
+import csv
+import logging
+import time
+
+from mppt_decoder import FIELDS
+from mppt_fleet import FleetAggregator
+from mppt_metrics import FAULT_EVENTS
+from mppt_outbox import Outbox
+from mppt_publisher import ChangeFilter, Deadband
+
+
+def _friendly_name(name):
+    return name.replace('_', ' ').title()
+
+
+# Status bitfields are published as fault binary sensors instead
+STATUS_FIELDS = ('operating_status', 'charging_status')
+
+
+# Sensor names and attribute payloads for one charger, built once:
+# {field: (sensor_name, attributes)}
+def charger_sensors(entity_prefix):
+    sensors = {}
+    for field in FIELDS:
+        if field.name in STATUS_FIELDS:
+            continue
+        attributes = {
+            'unit_of_measurement': field.unit or '',
+            'friendly_name': _friendly_name(field.name),
+        }
+        if field.state_class is not None:
+            attributes['state_class'] = field.state_class
+        if field.device_class is not None:
+            attributes['device_class'] = field.device_class
+        sensors[field.name] = (f"sensor.{entity_prefix}_{field.name}", attributes)
+    return sensors
+
+
+# Sensor names and attribute payloads of a group's combined sensors:
+# {'power' | 'power_generated_today' | 'total_kwh_generated': (sensor_name, attributes)}
+def group_sensors(group):
+    def sensor(suffix, unit, state_class, device_class):
+        return (f"sensor.{group}_{suffix}", {
+            'unit_of_measurement': unit,
+            'friendly_name': f"{_friendly_name(group)} {_friendly_name(suffix)}",
+            'state_class': state_class,
+            'device_class': device_class,
+        })
+    return {
+        'power': sensor('power', 'W', 'measurement', 'power'),
+        'power_generated_today': sensor('power_generated_today', 'kWh', 'total_increasing', 'energy'),
+        'total_kwh_generated': sensor('total_kwh_generated', 'kWh', 'total_increasing', 'energy'),
+    }
+
+
+# Binary sensors of a charger's fault and anomaly conditions:
+# {condition: (sensor_name, attributes)}
+def fault_sensors(entity_prefix, conditions):
+    return {
+        condition: (f"binary_sensor.{entity_prefix}_{condition}", {
+            'friendly_name': _friendly_name(condition),
+            'device_class': 'problem',
+        })
+        for condition in conditions
+    }
+
+
+# The collector: polls every configured port and publishes each cycle's
+# changed sensors, the groups' combined sensors, fault conditions, energy
+# reports and local history. Built from a normalised config (see mppt_config); optional
+# parts and their dependencies are only loaded when enabled.
+class Collector:
+    def __init__(self, config):
+        self.config = config
+        self.ports = config['ports']
+        publish = config['publish']
+
+        if publish['transport'] == 'mqtt':
+            from mppt_mqtt import MqttPublisher
+            mqtt = publish['mqtt']
+            self.publisher = MqttPublisher(mqtt['host'], mqtt['port'], mqtt['username'], mqtt['password'],
+                                           discovery_prefix=mqtt['discovery_prefix'],
+                                           base_topic=mqtt['base_topic'], timeout=publish['timeout'])
+        else:
+            from mppt_publisher import HomeAssistantPublisher
+            self.publisher = HomeAssistantPublisher(publish['url'], publish['token'], workers=publish['workers'],
+                                                    timeout=publish['timeout'])
+        self.outbox = Outbox(self.publisher, publish['outbox_path'])
+        deadbands = {field: Deadband(**deadband) for field, deadband in publish['deadbands'].items()}
+        self.change_filter = ChangeFilter(deadbands, publish['heartbeat'])
+
+        self.groups = config['groups']
+        self.fleet = FleetAggregator(self.groups, config['fleet_state_path'])
+        self.energy = None
+        if config['energy_report_path']:
+            from mppt_energy import EnergyIntegrator
+            self.energy = EnergyIntegrator(self.write_energy_report, state_path=config['energy_state_path'])
+        self.history = None
+        if config['history_port']:
+            from mppt_history import HistoryStore
+            self.history = HistoryStore()
+
+        self.faults = None
+        faults = dict(config['faults'])
+        peer_groups = faults.pop('peer_groups')
+        if faults.pop('enabled'):
+            from mppt_faults import CONDITIONS, FaultDetector
+            if peer_groups:
+                faults['peer_groups'] = {charger: group for group, chargers in peer_groups.items()
+                                         for charger in chargers}
+            self.faults = FaultDetector(**faults)
+
+        prefixes = [prefix for chargers in self.ports.values() for prefix in chargers.values()]
+        self.sensors = {prefix: charger_sensors(prefix) for prefix in prefixes}
+        self.group_sensors = {group: group_sensors(group) for group in self.groups}
+        self.fault_sensors = {}
+        if self.faults is not None:
+            self.fault_sensors = {prefix: fault_sensors(prefix, CONDITIONS) for prefix in prefixes}
+
+    # Append a completed hour or day of integrated yield to the report
+    def write_energy_report(self, charger, period, start, wh):
+        if isinstance(start, (int, float)):
+            start = time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(start))
+        logging.info(f"{charger} {period} {start}: {wh:.3f} Wh")
+        with open(self.config['energy_report_path'], 'a', newline='') as f:
+            csv.writer(f).writerow([charger, period, start, f"{wh:.3f}"])
+
+    # Publish one polling cycle ({address: Reading}) from the chargers on one port
+    def publish_cycle(self, cycle, chargers):
+        states = {}
+        self.collect_cycle_states(cycle, states, chargers)
+        self.outbox.put(states)
+        logging.debug(f"Home Assistant publish stats: {self.publisher.stats()}")
+
+    def publish_port_cycle(self, port, cycle):
+        self.publish_cycle(cycle, self.ports[port])
+
+    # Gather every sensor state of one polling cycle
+    def collect_cycle_states(self, cycle, states, chargers):
+        for address, data in cycle.items():
+            prefix = chargers[address]
+            sensors = self.sensors[prefix]
+            self.fleet.update(prefix, data)
+            # Energy counters are published as accepted by the fleet aggregator
+            published = data._replace(power_generated_today=self.fleet.today_kwh(prefix),
+                                      total_kwh_generated=self.fleet.lifetime_kwh(prefix))
+            for key, (sensor_name, attributes) in sensors.items():
+                value = getattr(published, key)
+                if self.change_filter.should_publish(sensor_name, key, value):
+                    states[sensor_name] = {'state': value, 'attributes': attributes}
+            if self.faults is not None:
+                self.collect_fault_states(prefix, data, states)
+            if self.energy is not None:
+                self.energy.update(prefix, data)
+            if self.history is not None:
+                self.history.add(prefix, data)
+
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info(f"MPPT Charger Data {address}:")
+                for key, value in data.as_dict().items():
+                    logging.info(f"{address} - {key}: {value}")
+
+        for group, sensors in self.group_sensors.items():
+            values = {
+                'power': self.fleet.group_power(group),
+                'power_generated_today': self.fleet.group_today_kwh(group),
+                'total_kwh_generated': self.fleet.group_lifetime_kwh(group),
+            }
+            for key, (sensor_name, attributes) in sensors.items():
+                value = values[key]
+                if self.change_filter.should_publish(sensor_name, key, value):
+                    states[sensor_name] = {'state': value, 'attributes': attributes}
+            logging.info(f"{group} power: {values['power']} W, total: {values['total_kwh_generated']} kWh")
+
+    # Run the fault detector on one reading and add its condition sensors
+    def collect_fault_states(self, prefix, data, states):
+        for event in self.faults.update(prefix, data):
+            if event.active:
+                FAULT_EVENTS.inc(event.condition)
+                logging.warning(f"{prefix}: {event.condition} {event.detail}".rstrip())
+            else:
+                logging.warning(f"{prefix}: {event.condition} cleared")
+        active = self.faults.active(prefix)
+        for condition, (sensor_name, attributes) in self.fault_sensors[prefix].items():
+            value = 'on' if active[condition] else 'off'
+            if self.change_filter.should_publish(sensor_name, condition, value):
+                states[sensor_name] = {'state': value, 'attributes': attributes}
+
+    def run(self):
+        config = self.config
+        if self.history is not None:
+            from mppt_history import serve as serve_history
+            serve_history(self.history, port=config['history_port'])
+        if config['metrics_port']:
+            from mppt_metrics import serve as serve_metrics
+            serve_metrics(port=config['metrics_port'])
+
+        if config['runtime'] == 'auto' and (config['supervisor'] or len(self.ports) > 1):
+            from mppt_supervisor import Supervisor
+            supervisor = Supervisor(self.ports, config['baud_rate'], self.publish_port_cycle,
+                                    retries=config['retries'], port_settings=config['port_settings'],
+                                    adaptive=config['adaptive_polling'], journal_dir=config['journal_dir'])
+            supervisor.run()
+            return
+
+        journal = None
+        if config['journal_dir']:
+            from mppt_journal import JournalWriter
+            journal = JournalWriter(config['journal_dir'])
+
+        if config['runtime'] == 'asyncio':
+            import asyncio
+            from mppt_async import run as run_async
+            asyncio.run(run_async(self.ports, config['baud_rate'], self.publish_port_cycle,
+                                  retries=config['retries'], port_settings=config['port_settings'],
+                                  adaptive=config['adaptive_polling'], journal=journal))
+            return
+
+        from mppt_adaptive import AdaptivePolicy
+        from mppt_bus import BusScheduler
+        from mppt_transport import open_transport
+        port, chargers = next(iter(self.ports.items()))
+        settings = config['port_settings'][port]
+        with open_transport(port, config['baud_rate'], **settings) as transport:
+            scheduler = BusScheduler(transport, chargers, config['baud_rate'],
+                                     lambda cycle: self.publish_cycle(cycle, chargers),
+                                     retries=config['retries'], timeout=settings['timeout'], journal=journal,
+                                     policy=AdaptivePolicy() if config['adaptive_polling'] else None, port=port)
+            scheduler.run()
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import socket
+import time
+from urllib.parse import urlparse
+
+from mppt_adaptive import AdaptivePolicy
+from mppt_bus import inter_frame_gap
+from mppt_decoder import build_command, decode_frame
+from mppt_metrics import CYCLE_DURATION, LAST_GOOD, SERIAL_ROUND_TRIP
+from mppt_stream import FrameAssembler, request_steps
+
+
+# Drop input the reader has received but not handed out yet. StreamReader
+# has no public call for this, so its buffer is cleared directly.
+def _discard_input(reader):
+    reader._buffer.clear()
+
+
+# asyncio counterpart of mppt_stream.request_frame: drives the same
+# request_steps over a stream reader and writer
+async def request_frame(reader, writer, command, assembler, retries=1, timeout=0.5, port=''):
+    steps = request_steps(command, assembler, retries, timeout, port)
+    data = None
+    try:
+        while True:
+            step = steps.send(data)
+            data = None
+            if isinstance(step, bytes):
+                _discard_input(reader)
+                writer.write(step)
+                await writer.drain()
+                continue
+            size, remaining = step
+            try:
+                data = await asyncio.wait_for(reader.read(size), remaining)
+            except asyncio.TimeoutError:
+                continue
+            if not data:
+                raise ConnectionError(f"Connection closed while polling MPPT address {command[0]}")
+    except StopIteration as e:
+        return e.value
+
+
+# Open a port setting as a stream reader and writer, as open_transport does:
+# 'tcp://host:port' for an Ethernet-RS485 gateway, anything else is a local
+# serial port
+async def open_stream(port, baud_rate, connect_timeout=3.0):
+    if port.startswith('tcp://'):
+        url = urlparse(port)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(url.hostname, url.port), connect_timeout)
+        sock = writer.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return reader, writer
+    # Imported here so gateways work without pyserial-asyncio
+    import serial_asyncio
+    return await serial_asyncio.open_serial_connection(url=port, baudrate=baud_rate)
+
+
+# Polls the chargers on one port the way mppt_bus.BusScheduler does
+# (round-robin with the inter-frame gap, optional adaptive policy and
+# journal), putting each round on the shared `results` queue as
+# (port, {address: Reading}). A failing connection is reopened with the
+# same backoff as mppt_transport, without affecting the other ports.
+class PortPoller:
+    def __init__(self, port, addresses, baud_rate, results, retries=1, timeout=0.5, connect_timeout=3.0, journal=None,
+                 port_id=0, policy=None, reconnect_min=1.0, reconnect_max=60.0):
+        self.port = port
+        self.addresses = list(addresses)
+        self.commands = {address: build_command(address) for address in self.addresses}
+        self.baud_rate = baud_rate
+        self.gap = inter_frame_gap(baud_rate)
+        self.results = results
+        self.retries = retries
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.journal = journal
+        self.port_id = port_id
+        self.policy = policy
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.assembler = FrameAssembler()
+        self.next_due = dict.fromkeys(self.addresses, 0.0)
+        self._last_frame = 0.0
+
+    async def run(self):
+        delay = 0.0
+        while True:
+            try:
+                reader, writer = await open_stream(self.port, self.baud_rate, self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                delay = min(max(delay * 2, self.reconnect_min), self.reconnect_max)
+                logging.error(f"Could not connect to {self.port}: {e}, retrying in {delay} seconds")
+                await asyncio.sleep(delay)
+                continue
+            if delay:
+                logging.warning(f"Reconnected to {self.port}")
+            self.assembler.clear()
+            try:
+                await self._run_cycles(reader, writer)
+            except (OSError, ConnectionError) as e:
+                delay = self.reconnect_min
+                logging.error(f"Connection to {self.port} lost: {e}, reconnecting in {delay} seconds")
+                await asyncio.sleep(delay)
+            finally:
+                writer.close()
+
+    async def _run_cycles(self, reader, writer):
+        while True:
+            start_time = time.monotonic()
+            cycle = {}
+            for address in self.addresses:
+                if self.policy is not None and self.next_due[address] > time.monotonic():
+                    continue
+                data = await self._poll(reader, writer, address)
+                if data is not None:
+                    cycle[address] = data
+                if self.policy is not None:
+                    if data is None:
+                        interval = self.policy.failed(address)
+                    else:
+                        interval = self.policy.interval(address, data)
+                    self.next_due[address] = time.monotonic() + interval
+            if not cycle and self.policy is not None:
+                # Nothing was due: idle until the next charger is
+                await asyncio.sleep(max(0.0, min(self.next_due.values()) - time.monotonic()))
+                continue
+            _put_latest(self.results, (self.port, cycle))
+            cycle_time = time.monotonic() - start_time
+            CYCLE_DURATION.set(self.port, cycle_time)
+            logging.info(f"{self.port} cycle time: {cycle_time} seconds")
+
+    # Query one charger, honouring the inter-frame gap; None on timeout
+    async def _poll(self, reader, writer, address):
+        wait = self._last_frame + self.gap - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        request_time = time.monotonic()
+        try:
+            response = await request_frame(reader, writer, self.commands[address], self.assembler,
+                                           self.retries, self.timeout, self.port)
+        except TimeoutError as e:
+            logging.warning(f"Error: {e}")
+            return None
+        finally:
+            self._last_frame = time.monotonic()
+        SERIAL_ROUND_TRIP.observe((self.port, address), self._last_frame - request_time)
+        LAST_GOOD.set((self.port, address), time.time())
+        if self.journal is not None:
+            self.journal.append(self.port_id, address, response)
+        return decode_frame(response)
+
+
+# Bounded queue put that drops the oldest round when the publisher is behind
+def _put_latest(results, item):
+    while True:
+        try:
+            results.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            try:
+                results.get_nowait()
+                logging.warning("Publisher is behind, dropping the oldest cycle")
+            except asyncio.QueueEmpty:
+                pass
+
+
+# Hand rounds to the (blocking) publish callable on a worker thread, one at
+# a time, so Home Assistant updates never stall the pollers
+async def publish_cycles(results, publish):
+    loop = asyncio.get_running_loop()
+    while True:
+        port, cycle = await results.get()
+        try:
+            await loop.run_in_executor(None, publish, port, cycle)
+        except Exception as e:
+            logging.error(f"Error: {e}")
+
+
+# Poll all ports concurrently on one event loop in this process. `ports` is
+# {port: addresses}, `port_settings` the per-port timeouts and
+# `publish(port, cycle)` receives each round as {address: Reading}, as with
+# mppt_supervisor.Supervisor. With a journal,
+# raw frames are recorded with the port's position in `ports` as its port id.
+async def run(ports, baud_rate, publish, retries=1, timeout=0.5, connect_timeout=3.0, port_settings=None,
+              adaptive=True, journal=None, queue_size=64):
+    port_settings = port_settings or {}
+    results = asyncio.Queue(maxsize=queue_size)
+    pollers = []
+    for port_id, (port, addresses) in enumerate(ports.items()):
+        settings = port_settings.get(port, {})
+        pollers.append(PortPoller(port, addresses, baud_rate, results, retries=retries,
+                                  timeout=settings.get('timeout', timeout),
+                                  connect_timeout=settings.get('connect_timeout', connect_timeout),
+                                  journal=journal, port_id=port_id, policy=AdaptivePolicy() if adaptive else None))
+    await asyncio.gather(publish_cycles(results, publish), *(poller.run() for poller in pollers))
@@ -0,0 +1,58 @@
+import numpy as np
+
+from mppt_decoder import FIELDS, FRAME_LENGTH
+
+# Structured dtype mirroring the decoder's field table, one record per frame
+_NUMPY_TYPES = {'B': 'u1', 'H': '>u2', 'I': '>u4'}
+
+FRAME_DTYPE = np.dtype({
+    'names': [field.name for field in FIELDS],
+    'formats': [_NUMPY_TYPES[field.fmt] for field in FIELDS],
+    'offsets': [field.offset for field in FIELDS],
+    'itemsize': FRAME_LENGTH,
+})
+
+
+# Frames decoded per pass; keeps each pass over the strided records in cache
+CHUNK_FRAMES = 16384
+
+
+# Check the checksum of every frame at once (low byte of the sum of bytes 0-91).
+# Summing in uint8 wraps modulo 256, which is exactly the checksum rule.
+def validate_checksums(raw):
+    calculated = raw[:, :FRAME_LENGTH - 1].sum(axis=1, dtype=np.uint8)
+    return calculated == raw[:, FRAME_LENGTH - 1]
+
+
+# Decode a contiguous buffer of N 93-byte frames into columns.
+# Returns (columns, valid) where columns maps field name to a NumPy array
+# (float64 for scaled fields, the raw integer type otherwise) and valid is a
+# boolean mask of frames whose checksum matched.
+def decode_frames(buffer):
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    if raw.size % FRAME_LENGTH:
+        raise ValueError("Buffer length is not a multiple of the frame length.")
+
+    raw = raw.reshape(-1, FRAME_LENGTH)
+    records = raw.view(FRAME_DTYPE).reshape(-1)
+    count = len(records)
+
+    columns = {}
+    for field in FIELDS:
+        if field.divisor is None:
+            columns[field.name] = np.empty(count, FRAME_DTYPE[field.name].newbyteorder('='))
+        else:
+            columns[field.name] = np.empty(count, np.float64)
+    valid = np.empty(count, np.bool_)
+
+    for start in range(0, count, CHUNK_FRAMES):
+        stop = start + CHUNK_FRAMES
+        chunk = records[start:stop]
+        for field in FIELDS:
+            if field.divisor is None:
+                columns[field.name][start:stop] = chunk[field.name]
+            else:
+                np.divide(chunk[field.name], field.divisor, out=columns[field.name][start:stop])
+        valid[start:stop] = validate_checksums(raw[start:stop])
+
+    return columns, valid
@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+
+from mppt_decoder import FRAME_LENGTH, build_command, decode_frame
+from mppt_metrics import CYCLE_DURATION, LAST_GOOD, SERIAL_ROUND_TRIP
+from mppt_stream import FrameAssembler, request_frame
+
+# Bits on the wire per byte with 8N1 framing
+BITS_PER_BYTE = 10
+# Minimum bus silence between frames, in character times
+INTER_FRAME_CHARS = 3.5
+
+
+# Seconds needed to send `length` bytes at the given baud rate
+def transfer_time(length, baud_rate):
+    return length * BITS_PER_BYTE / baud_rate
+
+
+# Minimum silent gap to leave between frames at the given baud rate
+def inter_frame_gap(baud_rate):
+    return INTER_FRAME_CHARS * BITS_PER_BYTE / baud_rate
+
+
+# Theoretical upper bound on polled frames per second for one bus
+def max_frames_per_second(baud_rate, command_length=8):
+    cycle = transfer_time(command_length + FRAME_LENGTH, baud_rate) + 2 * inter_frame_gap(baud_rate)
+    return 1 / cycle
+
+
+# Polls a list of charger addresses round-robin over a single open serial
+# port. Each completed round is handed to a separate publishing thread
+# through a bounded queue, so slow Home Assistant updates never hold up
+# the bus. When the queue is full the oldest round is dropped. With a
+# journal, every raw frame is also recorded under `port_id`. With an
+# adaptive policy (see mppt_adaptive), each charger is only polled when it
+# is due and a round contains just the chargers polled in it. Metrics are
+# labelled with `port`, the port setting (by default the transport's name).
+class BusScheduler:
+    def __init__(self, serial_port, addresses, baud_rate, publish, retries=1, timeout=0.5, queue_size=4,
+                 journal=None, port_id=0, policy=None, port=None):
+        self.serial_port = serial_port
+        self.port = str(serial_port) if port is None else port
+        self.addresses = list(addresses)
+        self.commands = {address: build_command(address) for address in self.addresses}
+        self.gap = inter_frame_gap(baud_rate)
+        self.publish = publish
+        self.retries = retries
+        self.timeout = timeout
+        self.assembler = FrameAssembler()
+        self.journal = journal
+        self.port_id = port_id
+        self.policy = policy
+        self.next_due = dict.fromkeys(self.addresses, 0.0)
+        self.results = queue.Queue(maxsize=queue_size)
+        self.samples = dict.fromkeys(self.addresses, 0)
+        self.failures = dict.fromkeys(self.addresses, 0)
+        self.started = time.monotonic()
+        self._last_frame = 0.0
+        self._stop = threading.Event()
+        self._publisher = threading.Thread(target=self._publish_loop, name='mppt-publisher', daemon=True)
+
+    # Query one charger, honouring the inter-frame gap; None on timeout
+    def poll(self, address):
+        wait = self._last_frame + self.gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        request_time = time.monotonic()
+        try:
+            response = request_frame(self.serial_port, self.commands[address], self.assembler,
+                                     retries=self.retries, timeout=self.timeout, port=self.port)
+        except (TimeoutError, ConnectionError) as e:
+            self.failures[address] += 1
+            logging.warning(f"Error: {e}")
+            return None
+        finally:
+            self._last_frame = time.monotonic()
+        self.samples[address] += 1
+        SERIAL_ROUND_TRIP.observe((self.port, address), self._last_frame - request_time)
+        LAST_GOOD.set((self.port, address), time.time())
+        if self.journal is not None:
+            self.journal.append(self.port_id, address, response)
+        return decode_frame(response)
+
+    # Poll every configured charger that is due once and return {address: data}
+    def run_cycle(self):
+        cycle = {}
+        for address in self.addresses:
+            if self.policy is not None and self.next_due[address] > time.monotonic():
+                continue
+            data = self.poll(address)
+            if data is not None:
+                cycle[address] = data
+            if self.policy is not None:
+                if data is None:
+                    interval = self.policy.failed(address)
+                else:
+                    interval = self.policy.interval(address, data)
+                self.next_due[address] = time.monotonic() + interval
+        return cycle
+
+    def run(self):
+        self._publisher.start()
+        while not self._stop.is_set():
+            start_time = time.monotonic()
+            cycle = self.run_cycle()
+            if not cycle and self.policy is not None:
+                # Nothing was due: idle until the next charger is
+                self._stop.wait(max(0.0, min(self.next_due.values()) - time.monotonic()))
+                continue
+            self._enqueue(cycle)
+            cycle_time = time.monotonic() - start_time
+            CYCLE_DURATION.set(self.port, cycle_time)
+            logging.info(f"Cycle time: {cycle_time} seconds")
+            logging.debug(f"Samples per second: {self.rates()}")
+
+    def stop(self):
+        self._stop.set()
+
+    # Achieved samples per second for each charger since the last reset
+    def rates(self):
+        elapsed = time.monotonic() - self.started
+        if elapsed <= 0:
+            return dict.fromkeys(self.addresses, 0.0)
+        return {address: count / elapsed for address, count in self.samples.items()}
+
+    def reset_stats(self):
+        self.samples = dict.fromkeys(self.addresses, 0)
+        self.failures = dict.fromkeys(self.addresses, 0)
+        self.started = time.monotonic()
+
+    def _enqueue(self, cycle):
+        while True:
+            try:
+                self.results.put_nowait(cycle)
+                return
+            except queue.Full:
+                try:
+                    self.results.get_nowait()
+                    logging.warning("Publisher is behind, dropping the oldest cycle")
+                except queue.Empty:
+                    pass
+
+    def _publish_loop(self):
+        while not self._stop.is_set():
+            try:
+                cycle = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.publish(cycle)
+            except Exception as e:
+                logging.error(f"Error: {e}")
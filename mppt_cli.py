@@ -0,0 +1,71 @@
+import argparse
+import json
+import logging
+import sys
+
+# Command line entry point (installed as `mppt`). Subcommands import what
+# they need when they run, so startup only pays for the command used.
+
+
+def _load(path):
+    from mppt_config import load_config
+    try:
+        return load_config(path)
+    except ImportError as e:
+        sys.exit(f"Cannot read {path}: {e} (TOML needs Python 3.11+ or the tomli package)")
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error in config {path}: {e}")
+
+
+def run(args):
+    from mppt_app import Collector
+    Collector(_load(args.config)).run()
+
+
+def show_config(args):
+    print(json.dumps(_load(args.config), indent=2, default=str))
+
+
+def query(args):
+    from mppt_decoder import build_command, parse_response
+    from mppt_stream import FrameAssembler, request_frame
+    from mppt_transport import open_transport
+    with open_transport(args.port, args.baud, timeout=args.timeout) as transport:
+        try:
+            response = request_frame(transport, build_command(args.address), FrameAssembler(),
+                                     retries=args.retries, timeout=args.timeout)
+        except (TimeoutError, ConnectionError) as e:
+            sys.exit(f"Error: {e}")
+    print("MPPT Charger Data:")
+    for key, value in parse_response(response).items():
+        print(f"{key}: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='mppt', description='MPPT charger to Home Assistant integration.')
+    parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('run', help='Poll the configured chargers and publish to Home Assistant')
+    command.add_argument('config', help='Config file (.toml or .json)')
+    command.set_defaults(func=run)
+
+    command = commands.add_parser('config', help='Print a config file with every default filled in')
+    command.add_argument('config', help='Config file (.toml or .json)')
+    command.set_defaults(func=show_config)
+
+    command = commands.add_parser('query', help='Query one charger once and print its data')
+    command.add_argument('--port', default='/dev/ttyUSB0', help='Serial port or tcp://host:port')
+    command.add_argument('--address', type=lambda value: int(value, 16) if value.lower().startswith('0x') else int(value), default=1, help='Charger address')
+    command.add_argument('--baud', type=int, default=9600, help='Baud rate')
+    command.add_argument('--timeout', type=float, default=1.0, help='Seconds to wait per attempt')
+    command.add_argument('--retries', type=int, default=3, help='Attempts before giving up')
+    command.set_defaults(func=query)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
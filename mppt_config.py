@@ -0,0 +1,137 @@
+import copy
+import json
+
+# Every setting with its default. A config file only needs the parts that
+# differ; `ports` is required.
+DEFAULTS = {
+    # {serial port or tcp://host:port: {charger address: entity prefix}}, or
+    # per port {'chargers': {...}, 'timeout': ..., 'connect_timeout': ...}
+    # to override the timeouts below for a slower bus or gateway
+    'ports': {},
+    'baud_rate': 9600,
+    'timeout': 0.5,
+    'connect_timeout': 3.0,  # For tcp:// gateways
+    'retries': 1,
+    'adaptive_polling': True,
+    # Force one worker process per port even with a single port
+    'supervisor': False,
+    # 'auto': one worker process per port when there are several (see
+    # `supervisor`); 'asyncio': every port polled on one event loop in this
+    # process (needs pyserial-asyncio for serial ports)
+    'runtime': 'auto',
+    # {group name: [entity prefix, ...]}; None combines every charger
+    'groups': None,
+    'publish': {
+        'transport': 'rest',
+        'url': 'http://homeassistant.local:8123',
+        'token': '',
+        'workers': 4,
+        'timeout': 5,
+        'mqtt': {
+            'host': 'localhost',
+            'port': 1883,
+            'username': None,
+            'password': None,
+            'discovery_prefix': 'homeassistant',
+            'base_topic': 'mppt',
+        },
+        'heartbeat': 60,
+        # {field: {'absolute': ..., 'relative': ...}}
+        'deadbands': {
+            'battery_voltage': {'absolute': 0.05},
+            'pv_voltage_in': {'absolute': 0.5},
+            'int_temp': {'absolute': 0.5},
+            'ext_temp': {'absolute': 0.5},
+        },
+        'outbox_path': 'mppt_outbox.jsonl',
+    },
+    # Fault and anomaly detection, published as binary sensors
+    'faults': {
+        'enabled': True,
+        'debounce': 3,  # Consecutive samples before a condition changes
+        'temp_rise': 2.0,  # int_temp rise in °C/min
+        'peer_ratio': 0.5,  # Below this fraction of the peers' power
+        'pv_band': 10.0,  # Peers are compared within PV voltage bands this wide
+        'min_peer_power': 50.0,
+        # {peer group: [entity prefix, ...]}; None compares every charger
+        'peer_groups': None,
+    },
+    'fleet_state_path': 'mppt_fleet_state.json',
+    'energy_report_path': 'mppt_energy.csv',
+    'energy_state_path': 'mppt_energy_state.json',
+    'journal_dir': None,
+    'history_port': None,
+    'metrics_port': None,
+}
+
+
+def _merge(defaults, overrides, path=''):
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if key not in defaults:
+            raise ValueError(f"Unknown setting {path}{key}")
+        if isinstance(defaults[key], dict) and key not in ('ports', 'deadbands'):
+            if not isinstance(value, dict):
+                raise ValueError(f"Setting {path}{key} must be a table")
+            value = _merge(defaults[key], value, f'{path}{key}.')
+        merged[key] = value
+    return merged
+
+
+# File formats only have string keys; addresses are bus bytes, written in
+# decimal (leading zeros allowed, e.g. "01") or as hex with a 0x prefix
+def _address(port, address):
+    if isinstance(address, str):
+        try:
+            address = int(address, 16) if address.lower().startswith('0x') else int(address)
+        except ValueError:
+            raise ValueError(f"Charger address {address!r} on {port} is not a number") from None
+    if not 0 <= address <= 0xFF:
+        raise ValueError(f"Charger address {address} on {port} is outside 0-255")
+    return address
+
+
+# Fill in defaults and normalise a config dict (as loaded from a file)
+def normalize_config(raw):
+    config = _merge(DEFAULTS, raw)
+    if not config['ports']:
+        raise ValueError("No ports configured")
+    if config['runtime'] not in ('auto', 'asyncio'):
+        raise ValueError(f"Unknown runtime {config['runtime']}")
+    # Split off the per-port timeouts: `ports` becomes {port: {address:
+    # prefix}} and `port_settings` {port: {'timeout', 'connect_timeout'}}
+    ports = {}
+    config['port_settings'] = {}
+    for port, chargers in config['ports'].items():
+        settings = {'timeout': config['timeout'], 'connect_timeout': config['connect_timeout']}
+        if 'chargers' in chargers:
+            chargers = dict(chargers)
+            for key in list(chargers):
+                if key in settings:
+                    settings[key] = chargers.pop(key)
+                elif key != 'chargers':
+                    raise ValueError(f"Unknown setting ports.{port}.{key}")
+            chargers = chargers['chargers']
+        ports[port] = {_address(port, address): prefix for address, prefix in chargers.items()}
+        config['port_settings'][port] = settings
+    config['ports'] = ports
+    if config['groups'] is None:
+        prefixes = [prefix for chargers in config['ports'].values() for prefix in chargers.values()]
+        config['groups'] = {'mppt_charger_combined': prefixes} if len(prefixes) > 1 else {}
+    return config
+
+
+# Load a .toml or .json config file
+def load_config(path):
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            # Python before 3.11
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            raw = tomllib.load(f)
+    else:
+        with open(path) as f:
+            raw = json.load(f)
+    return normalize_config(raw)
@@ -0,0 +1,176 @@
+import struct
+from collections import namedtuple
+
+# Length of a 0xB1 "query all data" response frame
+FRAME_LENGTH = 93
+COMMAND_QUERY_ALL_DATA = 0xB1
+
+# One entry per decoded field of the 0xB1 response.
+#   offset       - byte offset in the frame
+#   fmt          - struct format character (big-endian)
+#   divisor      - raw value is divided by this (None keeps the raw integer)
+#   unit         - Home Assistant unit_of_measurement
+#   device_class - Home Assistant device_class (None if not applicable)
+#   state_class  - Home Assistant state_class (None if not applicable)
+Field = namedtuple('Field', 'name offset fmt divisor unit device_class state_class')
+
+FIELDS = (
+    Field('mppt_address', 0, 'B', None, '', None, None),
+    Field('command_type', 1, 'B', None, '', None, None),
+    Field('control_code', 2, 'B', None, '', None, None),
+    Field('operating_status', 3, 'B', None, '', None, None),
+    Field('charging_status', 4, 'B', None, '', None, None),
+    Field('control_status', 5, 'B', None, '', None, None),
+    Field('battery_type', 8, 'B', None, '', None, None),
+    Field('battery_id_method', 9, 'B', None, '', None, None),
+    Field('number_of_batteries', 10, 'B', None, '', None, None),
+    Field('load_control_mode', 11, 'B', None, '', None, None),
+    Field('mppt_address_confirm', 12, 'B', None, '', None, None),
+    Field('baud_rate', 13, 'B', None, '', None, None),
+    Field('rated_voltage_level', 16, 'H', 100, 'V', 'voltage', None),
+    Field('upper_charge_voltage', 18, 'H', 100, 'V', 'voltage', None),
+    Field('float_voltage_limit', 20, 'H', 100, 'V', 'voltage', None),
+    Field('low_voltage_discharge_limit', 22, 'H', 100, 'V', 'voltage', None),
+    Field('hardware_max_charging_current_limit', 24, 'H', 100, 'A', 'current', None),
+    Field('defined_charge_limit', 26, 'H', 100, 'A', 'current', None),
+    Field('running_charging_current_limit', 28, 'H', 100, 'A', 'current', None),
+    Field('pv_voltage_in', 30, 'H', 10, 'V', 'voltage', 'measurement'),
+    Field('battery_voltage', 32, 'H', 100, 'V', 'voltage', 'measurement'),
+    Field('charging_current', 34, 'H', 100, 'A', 'current', 'measurement'),
+    Field('int_temp', 36, 'H', 10, '°C', 'temperature', 'measurement'),
+    # bytes 38-39 are the second internal probe, not fitted on most units
+    Field('ext_temp', 40, 'H', 10, '°C', 'temperature', 'measurement'),
+    # bytes 44-47 are a 32-bit Wh counter for today (0x000002a0 = 672 Wh in
+    # the sample frame), not a day count as earlier notes assumed
+    Field('power_generated_today', 44, 'I', 1000, 'kWh', 'energy', 'total_increasing'),
+    Field('total_kwh_generated', 48, 'I', 1000, 'kWh', 'energy', 'total_increasing'),
+)
+
+FIELD_NAMES = tuple(field.name for field in FIELDS)
+FIELDS_BY_NAME = {field.name: field for field in FIELDS}
+UNITS = {field.name: field.unit for field in FIELDS if field.unit}
+
+# Bit names of the two status bytes, indexed by bit number
+OPERATING_STATUS_BITS = (
+    'battery_auto_identification',
+    'battery_over_discharge_protection',
+    'fan_status',
+    'temp_status',
+    'dc_output_status',
+    'int_temp_probe_1_status',
+    'int_temp_probe_2_status',
+    'ext_temp_probe_status',
+)
+
+CHARGING_STATUS_BITS = (
+    'charging',
+    'equalizing_charge',
+    'tracking',
+    'floating_charge',
+    'charging_current_limit',
+    'charging_derating',
+    'remote_control_prohibits_charging',
+    'pv_overvoltage',
+)
+
+
+# Build a single big-endian struct covering every field, padding the gaps
+def _build_struct(fields):
+    fmt = '>'
+    position = 0
+    for field in sorted(fields, key=lambda f: f.offset):
+        if field.offset < position:
+            raise ValueError(f"Field {field.name} overlaps the previous field.")
+        if field.offset > position:
+            fmt += f'{field.offset - position}x'
+        fmt += field.fmt
+        position = field.offset + struct.calcsize('>' + field.fmt)
+    return struct.Struct(fmt)
+
+
+_FRAME_STRUCT = _build_struct(FIELDS)
+_DIVISORS = tuple(field.divisor for field in sorted(FIELDS, key=lambda f: f.offset))
+_SCALED = tuple(i for i, divisor in enumerate(_DIVISORS) if divisor is not None)
+
+
+# Bit mask of the named status bits, for testing a raw status byte directly
+def status_mask(names, *bits):
+    mask = 0
+    for name in bits:
+        mask |= 1 << names.index(name)
+    return mask
+
+
+# Status bits that report a fault, as (status field, bit name). The other
+# operating bits describe the setup (battery identification, DC output,
+# probes fitted) and are set on healthy chargers.
+FAULT_BITS = (
+    ('operating_status', 'battery_over_discharge_protection'),
+    ('operating_status', 'fan_status'),
+    ('operating_status', 'temp_status'),
+    ('charging_status', 'pv_overvoltage'),
+)
+OPERATING_FAULT_MASK = status_mask(OPERATING_STATUS_BITS,
+                                   *(name for field, name in FAULT_BITS if field == 'operating_status'))
+CHARGING_FAULT_MASK = status_mask(CHARGING_STATUS_BITS,
+                                  *(name for field, name in FAULT_BITS if field == 'charging_status'))
+
+_OPERATING_MASKS = tuple((name, 1 << bit) for bit, name in enumerate(OPERATING_STATUS_BITS))
+_CHARGING_MASKS = tuple((name, 1 << bit) for bit, name in enumerate(CHARGING_STATUS_BITS))
+
+
+# Expand a status byte into a dict of named bools
+def _expand_masks(value, masks):
+    return {name: value & mask != 0 for name, mask in masks}
+
+
+class Reading(namedtuple('Reading', [f.name for f in sorted(FIELDS, key=lambda f: f.offset)])):
+    __slots__ = ()
+
+    # Status bitfields are only expanded when asked for
+    @property
+    def operating_flags(self):
+        return _expand_masks(self.operating_status, _OPERATING_MASKS)
+
+    @property
+    def charging_flags(self):
+        return _expand_masks(self.charging_status, _CHARGING_MASKS)
+
+    # Dict in the layout parse_response has always returned
+    def as_dict(self):
+        data = dict(zip(self._fields, self))
+        data['operating_status'] = _expand_masks(self.operating_status, _OPERATING_MASKS)
+        data['charging_status'] = _expand_masks(self.charging_status, _CHARGING_MASKS)
+        return data
+
+
+# Checksum is the low byte of the sum of the preceding bytes
+def calculate_checksum(data):
+    return sum(data) & 0xFF
+
+
+# Build the 8-byte command frame for a charger address
+def build_command(address, command_type=COMMAND_QUERY_ALL_DATA):
+    command = bytes((address, command_type, 0x01, 0x00, 0x00, 0x00, 0x00))
+    return command + bytes((calculate_checksum(command),))
+
+
+# Function to validate checksum of a complete response frame
+def validate_checksum(response):
+    return calculate_checksum(memoryview(response)[:FRAME_LENGTH - 1]) == response[FRAME_LENGTH - 1]
+
+
+# Decode a 0xB1 response frame into a Reading
+def decode_frame(response):
+    if len(response) < FRAME_LENGTH:
+        raise ValueError("Response length is shorter than expected.")
+
+    values = list(_FRAME_STRUCT.unpack_from(memoryview(response)))
+    for i in _SCALED:
+        values[i] = values[i] / _DIVISORS[i]
+    return Reading._make(values)
+
+
+# Function to parse the response from the MPPT charger
+def parse_response(response):
+    return decode_frame(response).as_dict()
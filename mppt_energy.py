@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import time
+
+HOUR = 3600
+
+# Longest interval between two samples that is still integrated; across a
+# longer gap the charger's own counter accounts for the missing energy
+MAX_GAP = 300
+
+
+# Running integration state of one charger
+class _EnergyState:
+    __slots__ = ('timestamp', 'power', 'hour_start', 'hour_end', 'hour_wh',
+                 'day', 'day_end', 'day_wh', 'integrated_wh', 'counter_base', 'counter')
+
+    def __init__(self):
+        self.timestamp = None
+        self.power = 0.0
+        self.hour_start = None
+        self.hour_end = None
+        self.hour_wh = 0.0
+        self.day = None
+        self.day_end = None
+        self.day_wh = 0.0
+        self.integrated_wh = 0.0
+        self.counter_base = None
+        self.counter = None
+
+
+# Start of the local hour holding `timestamp` (in half-hour zones not the
+# UTC hour)
+def _hour_start(timestamp):
+    local = time.localtime(timestamp)
+    return int(timestamp) - local.tm_min * 60 - local.tm_sec
+
+
+# Local midnight following `timestamp`
+def _next_midnight(timestamp):
+    local = time.localtime(timestamp)
+    return time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+# Streaming energy accounting from instantaneous output power
+# (charging_current x battery_voltage). Consecutive samples are integrated
+# with the trapezoidal rule over their actual spacing, split exactly at hour
+# and local-day boundaries, so irregular polling intervals are handled
+# without resampling. Intervals longer than `max_gap` are not integrated.
+#
+# The integrated total is reconciled against total_kwh_generated: the
+# counter is floored to whole Wh, so the true energy since the first counter
+# reading lies within 1 Wh of the counter's increase. Whenever the integral
+# drifts outside that band (a gap, a missed peak, meter error) it is pulled
+# back to the band edge and the correction is booked in the current hour.
+# Readings of 0 or below the last counter value are ignored.
+#
+# Only the current hour and day are held per charger; each one is handed to
+# `emit(charger, period, start, wh)` ('hour' or 'day') once it is complete.
+# With a `state_path`, the open periods are saved there after each completed
+# period and every `save_interval` seconds and picked up on restart, so a
+# restart does not cut a day short in the report.
+class EnergyIntegrator:
+    def __init__(self, emit=None, max_gap=MAX_GAP, state_path=None, save_interval=60):
+        self.emit = emit
+        self.max_gap = max_gap
+        self.chargers = {}
+        self.state_path = state_path
+        self.save_interval = save_interval
+        self._last_save = time.monotonic()
+        self._closed = False
+        self._load()
+
+    # Feed one reading (a decoded Reading) from `charger`
+    def update(self, charger, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        state = self.chargers.get(charger)
+        if state is None:
+            state = self.chargers[charger] = _EnergyState()
+        power = data.charging_current * data.battery_voltage
+
+        if state.timestamp is None:
+            self._open_hour(charger, state, timestamp)
+            self._open_day(charger, state, timestamp)
+        elif timestamp > state.timestamp:
+            if timestamp - state.timestamp <= self.max_gap:
+                self._integrate(charger, state, timestamp, power)
+            else:
+                self._roll(charger, state, timestamp)
+        else:
+            # Out-of-order or repeated sample
+            return
+        state.timestamp = timestamp
+        state.power = power
+
+        self._reconcile(state, round(data.total_kwh_generated * 1000))
+
+        if self.state_path and (self._closed or time.monotonic() - self._last_save >= self.save_interval):
+            self.save()
+
+    # Trapezoidal rule from the previous sample, split at period boundaries
+    # using the linearly interpolated power there
+    def _integrate(self, charger, state, timestamp, power):
+        start, start_power = state.timestamp, state.power
+        slope = (power - start_power) / (timestamp - start)
+        while True:
+            end = min(timestamp, state.hour_end, state.day_end)
+            end_power = power if end == timestamp else start_power + slope * (end - start)
+            wh = (start_power + end_power) / 2 * (end - start) / HOUR
+            state.hour_wh += wh
+            state.day_wh += wh
+            state.integrated_wh += wh
+            if end == timestamp:
+                return
+            self._roll(charger, state, end)
+            start, start_power = end, end_power
+
+    # Close every period that ends at or before `timestamp`
+    def _roll(self, charger, state, timestamp):
+        if timestamp >= state.hour_end:
+            self._close(charger, 'hour', state.hour_start, state.hour_wh)
+            self._open_hour(charger, state, timestamp)
+        if timestamp >= state.day_end:
+            self._close(charger, 'day', state.day, state.day_wh)
+            self._open_day(charger, state, timestamp)
+
+    def _open_hour(self, charger, state, timestamp):
+        state.hour_start = _hour_start(timestamp)
+        state.hour_end = state.hour_start + HOUR
+        state.hour_wh = 0.0
+
+    def _open_day(self, charger, state, timestamp):
+        state.day = time.strftime('%Y-%m-%d', time.localtime(timestamp))
+        state.day_end = _next_midnight(timestamp)
+        state.day_wh = 0.0
+
+    def _close(self, charger, period, start, wh):
+        self._closed = True
+        if self.emit is not None:
+            self.emit(charger, period, start, wh)
+
+    def _reconcile(self, state, counter):
+        if counter <= 0 or (state.counter is not None and counter < state.counter):
+            return
+        state.counter = counter
+        if state.counter_base is None:
+            state.counter_base = counter
+            return
+        expected = counter - state.counter_base
+        if state.integrated_wh < expected - 1:
+            correction = expected - 1 - state.integrated_wh
+        elif state.integrated_wh > expected + 1:
+            # Never take back more than the open hour holds
+            correction = max(expected + 1 - state.integrated_wh, -state.hour_wh)
+        else:
+            return
+        state.hour_wh += correction
+        state.day_wh += correction
+        state.integrated_wh += correction
+
+    # Energy so far in the current hour / local day, in Wh
+    def hour_wh(self, charger):
+        state = self.chargers.get(charger)
+        return state.hour_wh if state is not None else 0.0
+
+    def today_wh(self, charger):
+        state = self.chargers.get(charger)
+        return state.day_wh if state is not None else 0.0
+
+    def save(self):
+        if not self.state_path:
+            return
+        state = {
+            charger: {name: getattr(s, name) for name in _EnergyState.__slots__}
+            for charger, s in self.chargers.items()
+        }
+        temporary = f'{self.state_path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, self.state_path)
+        self._last_save = time.monotonic()
+        self._closed = False
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not load energy state from {self.state_path}: {e}")
+            return
+        for charger, values in saved.items():
+            state = self.chargers[charger] = _EnergyState()
+            for name in _EnergyState.__slots__:
+                setattr(state, name, values[name])
@@ -0,0 +1,179 @@
+import time
+from collections import namedtuple
+
+from mppt_decoder import CHARGING_STATUS_BITS, FAULT_BITS, OPERATING_STATUS_BITS, status_mask
+
+# (condition, status field, mask) for testing FAULT_BITS on the raw status bytes
+_FAULT_MASKS = tuple(
+    (name, field, status_mask(OPERATING_STATUS_BITS if field == 'operating_status' else CHARGING_STATUS_BITS, name))
+    for field, name in FAULT_BITS
+)
+
+# Every condition the detector tracks per charger
+CONDITIONS = tuple(name for _, name in FAULT_BITS) + ('int_temp_rising', 'underperforming')
+
+# A debounced change of `condition` on `charger`; `active` is its new state
+Event = namedtuple('Event', 'time charger condition active detail')
+
+
+# Fixed-size ring of (timestamp, value) samples that also drops samples
+# older than `window` seconds, so the oldest kept sample is found in O(1)
+class _Ring:
+    __slots__ = ('times', 'values', 'start', 'count', 'window')
+
+    def __init__(self, size, window):
+        self.times = [0.0] * size
+        self.values = [0.0] * size
+        self.start = 0
+        self.count = 0
+        self.window = window
+
+    def push(self, timestamp, value):
+        size = len(self.times)
+        if self.count == size:
+            self.start = (self.start + 1) % size
+            self.count -= 1
+        end = (self.start + self.count) % size
+        self.times[end] = timestamp
+        self.values[end] = value
+        self.count += 1
+        while self.count > 1 and timestamp - self.times[self.start] > self.window:
+            self.start = (self.start + 1) % size
+            self.count -= 1
+
+    def oldest(self):
+        return self.times[self.start], self.values[self.start]
+
+    def newest_time(self):
+        return self.times[(self.start + self.count - 1) % len(self.times)]
+
+
+# Per-charger detector state
+class _ChargerState:
+    __slots__ = ('active', 'streak', 'temps', 'powers', 'power_index', 'power_count', 'power_sum',
+                 'mean_power', 'bucket')
+
+    def __init__(self, temp_samples, temp_window, power_samples):
+        self.active = dict.fromkeys(CONDITIONS, False)
+        self.streak = dict.fromkeys(CONDITIONS, 0)
+        self.temps = _Ring(temp_samples, temp_window)
+        self.powers = [0.0] * power_samples
+        self.power_index = 0
+        self.power_count = 0
+        self.power_sum = 0.0
+        self.mean_power = 0.0
+        self.bucket = None
+
+
+# Streaming fault and anomaly detection on decoded readings. Every sample
+# costs constant time and each charger holds fixed-size rings only:
+#   - fault bits (FAULT_BITS) are tracked as conditions of their own
+#   - int_temp_rising: int_temp rose faster than `temp_rise` °C/min between
+#     the oldest sample in the last `temp_window` seconds (at least
+#     `min_temp_span` seconds back) and the latest. The ring keeps at most
+#     one sample per `temp_window / temp_samples` seconds, so it spans the
+#     window at any polling rate
+#   - underperforming: the mean power of a charger's last `power_samples`
+#     readings is below `peer_ratio` x the mean of its peers whose PV input
+#     is in the same `pv_band` volt band, when that mean is at least
+#     `min_peer_power` W. Peers are all chargers of the same entry in
+#     `peer_groups` ({charger: group}; by default all chargers), and each
+#     peer counts with its latest mean, kept in running per-band sums.
+# A condition only changes state after `debounce` consecutive samples
+# disagree with it, and each change is returned as an Event.
+class FaultDetector:
+    def __init__(self, debounce=3, temp_rise=2.0, temp_window=120.0, min_temp_span=60.0, temp_samples=64,
+                 peer_ratio=0.5, pv_band=10.0, min_peer_power=50.0, power_samples=5, peer_groups=None):
+        self.debounce = debounce
+        self.temp_rise = temp_rise
+        self.temp_window = temp_window
+        self.min_temp_span = min_temp_span
+        self.temp_samples = temp_samples
+        self.temp_interval = temp_window / temp_samples
+        self.peer_ratio = peer_ratio
+        self.pv_band = pv_band
+        self.min_peer_power = min_peer_power
+        self.power_samples = power_samples
+        self.peer_groups = peer_groups or {}
+        self.chargers = {}
+        # (peer group, pv band) -> [sum of mean powers, number of chargers]
+        self.bands = {}
+
+    # Feed one reading (a decoded Reading); returns the list of Events
+    def update(self, charger, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        state = self.chargers.get(charger)
+        if state is None:
+            state = self.chargers[charger] = _ChargerState(self.temp_samples, self.temp_window,
+                                                           self.power_samples)
+
+        observed = {name: getattr(data, field) & mask != 0 for name, field, mask in _FAULT_MASKS}
+        observed['int_temp_rising'], rate = self._temperature(state, timestamp, data.int_temp)
+        observed['underperforming'], peer_power = self._peers(charger, state, data)
+
+        events = []
+        for condition, value in observed.items():
+            if value == state.active[condition]:
+                state.streak[condition] = 0
+                continue
+            state.streak[condition] += 1
+            if state.streak[condition] < self.debounce:
+                continue
+            state.streak[condition] = 0
+            state.active[condition] = value
+            if condition == 'int_temp_rising':
+                detail = f"int_temp {data.int_temp} °C, rising {rate:.1f} °C/min" if value else ''
+            elif condition == 'underperforming':
+                detail = f"{state.mean_power:.0f} W vs peers {peer_power:.0f} W" if value else ''
+            else:
+                detail = ''
+            events.append(Event(timestamp, charger, condition, value, detail))
+        return events
+
+    # Current (debounced) state of every condition for a charger
+    def active(self, charger):
+        state = self.chargers.get(charger)
+        return state.active if state is not None else dict.fromkeys(CONDITIONS, False)
+
+    def _temperature(self, state, timestamp, temperature):
+        temps = state.temps
+        if not temps.count or timestamp - temps.newest_time() >= self.temp_interval:
+            temps.push(timestamp, temperature)
+        oldest_time, oldest_temperature = temps.oldest()
+        span = timestamp - oldest_time
+        if span < self.min_temp_span:
+            return False, 0.0
+        rate = (temperature - oldest_temperature) / span * 60
+        return rate > self.temp_rise, rate
+
+    def _peers(self, charger, state, data):
+        power = data.charging_current * data.battery_voltage
+        index = state.power_index
+        if state.power_count == len(state.powers):
+            state.power_sum -= state.powers[index]
+        else:
+            state.power_count += 1
+        state.powers[index] = power
+        state.power_sum += power
+        state.power_index = (index + 1) % len(state.powers)
+
+        if state.bucket is not None:
+            band = self.bands[state.bucket]
+            band[0] -= state.mean_power
+            band[1] -= 1
+            if not band[1]:
+                # Clear accumulated rounding error
+                band[0] = 0.0
+        state.mean_power = state.power_sum / state.power_count
+        state.bucket = (self.peer_groups.get(charger), int(data.pv_voltage_in // self.pv_band))
+        band = self.bands.setdefault(state.bucket, [0.0, 0])
+        band[0] += state.mean_power
+        band[1] += 1
+
+        if band[1] < 2:
+            return False, 0.0
+        peer_power = (band[0] - state.mean_power) / (band[1] - 1)
+        if peer_power < self.min_peer_power:
+            return False, peer_power
+        return state.mean_power < self.peer_ratio * peer_power, peer_power
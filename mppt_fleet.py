@@ -0,0 +1,187 @@
+import datetime
+import json
+import logging
+import os
+import time
+
+# Fixed-point units: current and voltage arrive with 2 decimals, so power is
+# kept in 1e-4 W; energy counters are kept in Wh
+_POWER_SCALE = 10000
+
+# A today's counter reading at or below this many Wh counts as a reset to zero
+RESET_WH = 20
+
+
+# Local calendar day of a timestamp, as a date ordinal
+def _day(timestamp):
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+# Per-charger accepted counters and contribution to its groups. `day` is the
+# local day the today's counter was last reset (or first seen) on, and
+# `pending` counts consecutive readings that look like a reset.
+class _ChargerState:
+    __slots__ = ('power', 'today_wh', 'lifetime_wh', 'day', 'pending')
+
+    def __init__(self, today_wh=0, lifetime_wh=0, day=None):
+        self.power = 0
+        self.today_wh = today_wh
+        self.lifetime_wh = lifetime_wh
+        self.day = day
+        self.pending = 0
+
+
+# Combined power, today's energy and lifetime energy over any number of
+# chargers and groups (per battery bank, per site, ...). Each reading only
+# applies its charger's change to the running group totals, so an update is
+# O(groups the charger belongs to) rather than a recomputation.
+#
+# Every charger's energy counters are protected, so their total_increasing
+# sensors never see a glitch as a meter reset:
+#   - lifetime: a reading of 0 or a value lower than the last accepted one
+#     is ignored
+#   - today: a lower reading is only accepted as the charger's reset when
+#     it is from a later local day than the last reset, or drops to at most
+#     RESET_WH (e.g. after a restart of the charger), for `reset_samples`
+#     consecutive readings; other drops are ignored
+# Group totals add up the non-negative changes of their members' accepted
+# counters. A group's today's energy resets once, when the first member
+# starts a new day; members resetting later that day count on from zero
+# instead of lowering the total. The accepted counters are persisted to
+# `state_path` across restarts.
+class FleetAggregator:
+    def __init__(self, groups, state_path=None, save_interval=60, reset_samples=3):
+        self.groups = {group: tuple(chargers) for group, chargers in groups.items()}
+        self.memberships = {}
+        for group, chargers in self.groups.items():
+            for charger in chargers:
+                self.memberships.setdefault(charger, []).append(group)
+        self.power = dict.fromkeys(self.groups, 0)
+        self.today_wh = dict.fromkeys(self.groups, 0)
+        self.lifetime_wh = dict.fromkeys(self.groups, 0)
+        # Local day each group's today's energy was last reset on
+        self.days = dict.fromkeys(self.groups, 0)
+        self.chargers = {}
+        self.state_path = state_path
+        self.save_interval = save_interval
+        self.reset_samples = reset_samples
+        self._last_save = time.monotonic()
+        self._dirty = False
+        self._load()
+
+    # Apply one reading (a decoded Reading) from `charger`
+    def update(self, charger, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        groups = self.memberships.get(charger, ())
+        state = self.chargers.get(charger)
+        if state is None:
+            state = self.chargers[charger] = _ChargerState(day=_day(timestamp))
+
+        power = round(data.charging_current * 100) * round(data.battery_voltage * 100)
+        today_wh = round(data.power_generated_today * 1000)
+        lifetime_wh = round(data.total_kwh_generated * 1000)
+
+        self._apply(groups, self.power, power - state.power)
+        state.power = power
+        if today_wh >= state.today_wh:
+            state.pending = 0
+            if today_wh > state.today_wh:
+                self._apply(groups, self.today_wh, today_wh - state.today_wh)
+                state.today_wh = today_wh
+                self._dirty = True
+        else:
+            self._drop(groups, state, today_wh, timestamp)
+        if lifetime_wh > state.lifetime_wh:
+            self._apply(groups, self.lifetime_wh, lifetime_wh - state.lifetime_wh)
+            state.lifetime_wh = lifetime_wh
+            self._dirty = True
+
+        if self._dirty and self.state_path and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    # A today's counter reading below the accepted one: a glitch, or the
+    # charger's daily reset once it has persisted
+    def _drop(self, groups, state, today_wh, timestamp):
+        day = _day(timestamp)
+        if day == state.day and (today_wh > RESET_WH or state.today_wh <= RESET_WH):
+            state.pending = 0
+            return
+        state.pending += 1
+        if state.pending < self.reset_samples:
+            return
+        state.pending = 0
+        state.today_wh = today_wh
+        state.day = day
+        for group in groups:
+            if day > self.days[group]:
+                self.today_wh[group] = 0
+                self.days[group] = day
+            self.today_wh[group] += today_wh
+        self._dirty = True
+
+    @staticmethod
+    def _apply(groups, totals, delta):
+        if delta:
+            for group in groups:
+                totals[group] += delta
+
+    # Combined power of a group in W, truncated to 0.1 W
+    def group_power(self, group):
+        return self.power[group] // (_POWER_SCALE // 10) / 10
+
+    def group_today_kwh(self, group):
+        return self.today_wh[group] / 1000
+
+    def group_lifetime_kwh(self, group):
+        return self.lifetime_wh[group] / 1000
+
+    # A charger's accepted counters in kWh, for its own sensors
+    def today_kwh(self, charger):
+        return self.chargers[charger].today_wh / 1000
+
+    def lifetime_kwh(self, charger):
+        return self.chargers[charger].lifetime_wh / 1000
+
+    def save(self):
+        if not self.state_path:
+            return
+        state = {
+            'chargers': {
+                charger: {'today_wh': s.today_wh, 'lifetime_wh': s.lifetime_wh, 'day': s.day}
+                for charger, s in self.chargers.items()
+            },
+            'groups': {
+                group: {'today_wh': self.today_wh[group], 'day': self.days[group]}
+                for group in self.groups
+            },
+        }
+        temporary = f'{self.state_path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, self.state_path)
+        self._last_save = time.monotonic()
+        self._dirty = False
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not load fleet state from {self.state_path}: {e}")
+            return
+        # Files from before group totals were saved only hold {charger: counters}
+        if 'chargers' not in saved or 'groups' not in saved:
+            saved = {'chargers': saved, 'groups': {}}
+        for charger, values in saved['chargers'].items():
+            state = self.chargers[charger] = _ChargerState(values['today_wh'], values['lifetime_wh'],
+                                                           values.get('day'))
+            groups = self.memberships.get(charger, ())
+            self._apply(groups, self.today_wh, state.today_wh)
+            self._apply(groups, self.lifetime_wh, state.lifetime_wh)
+        for group, values in saved['groups'].items():
+            if group in self.groups:
+                self.today_wh[group] = values['today_wh']
+                self.days[group] = values['day']
@@ -0,0 +1,254 @@
+import datetime
+import json
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+
+from mppt_decoder import FIELDS
+
+# Fields worth keeping history for: the live measurements and energy counters
+HISTORY_FIELDS = tuple(field.name for field in FIELDS if field.state_class is not None)
+
+DAY = 86400
+
+# Rollup resolutions in seconds and how long each is kept; DAY buckets are
+# local calendar days
+ROLLUPS = (
+    (60, 7 * DAY),
+    (900, 90 * DAY),
+    (DAY, 10 * 365 * DAY),
+)
+
+
+# Number of the bucket holding `timestamp`: whole resolutions since the
+# epoch, or the ordinal of the local calendar day for DAY buckets
+def _bucket_number(timestamp, resolution):
+    if resolution == DAY:
+        return datetime.date.fromtimestamp(timestamp).toordinal()
+    return int(timestamp // resolution)
+
+
+# Start time of a bucket; day buckets run from local midnight to midnight
+# (23 or 25 hours across DST changes)
+def _bucket_time(number, resolution):
+    if resolution == DAY:
+        day = datetime.date.fromordinal(number)
+        return int(time.mktime((day.year, day.month, day.day, 0, 0, 0, 0, 0, -1)))
+    return number * resolution
+
+
+# Raw samples per column chunk before it is compressed
+CHUNK_SIZE = 4096
+
+
+# Rollup buckets of one series at one resolution as fixed-size ring
+# columns: bucket number n lives in slot n % size, and `numbers` records
+# which bucket each slot holds, so a new bucket overwrites the one that has
+# just passed its retention. Each field has min, max, sum and last columns;
+# the sample count is shared, as every reading updates every field.
+class _Rollup:
+    def __init__(self, field_count, size):
+        self.size = size
+        self.numbers = array('q', [-1]) * size
+        self.counts = array('d', bytes(8 * size))
+        self.columns = [tuple(array('d', bytes(8 * size)) for _ in range(4)) for _ in range(field_count)]
+
+    def add(self, number, values):
+        slot = number % self.size
+        held = self.numbers[slot]
+        if held != number:
+            if held > number:
+                # Older than the retention
+                return
+            self.numbers[slot] = number
+            self.counts[slot] = 1
+            for (mins, maxs, sums, lasts), value in zip(self.columns, values):
+                mins[slot] = maxs[slot] = sums[slot] = lasts[slot] = value
+            return
+        self.counts[slot] += 1
+        for (mins, maxs, sums, lasts), value in zip(self.columns, values):
+            if value < mins[slot]:
+                mins[slot] = value
+            if value > maxs[slot]:
+                maxs[slot] = value
+            sums[slot] += value
+            lasts[slot] = value
+
+    # Copies of the columns a query of one field needs
+    def snapshot(self, index):
+        return (self.numbers[:], self.counts[:]) + tuple(column[:] for column in self.columns[index])
+
+
+# Raw samples of one series (charger) as per-field columns. The open chunk
+# is a plain array; full chunks are zlib-compressed and the oldest are
+# dropped once `max_chunks` is reached, so memory stays bounded.
+class _RawColumns:
+    def __init__(self, fields, max_chunks):
+        self.fields = fields
+        self.chunks = deque(maxlen=max_chunks)
+        self._new_chunk()
+
+    def _new_chunk(self):
+        self.timestamps = array('d')
+        self.columns = {field: array('d') for field in self.fields}
+
+    def append(self, timestamp, data):
+        self.timestamps.append(timestamp)
+        for field, column in self.columns.items():
+            column.append(getattr(data, field))
+        if len(self.timestamps) >= CHUNK_SIZE:
+            compressed = {field: zlib.compress(column.tobytes()) for field, column in self.columns.items()}
+            self.chunks.append((self.timestamps[0], self.timestamps[-1],
+                                zlib.compress(self.timestamps.tobytes()), compressed))
+            self._new_chunk()
+
+    def range(self, field, start, end):
+        points = []
+        for first, last, timestamps, columns in self.chunks:
+            if last < start or first >= end:
+                continue
+            times = array('d', zlib.decompress(timestamps))
+            values = array('d', zlib.decompress(columns[field]))
+            points.extend((t, v) for t, v in zip(times, values) if start <= t < end)
+        points.extend((t, v) for t, v in zip(self.timestamps, self.columns[field]) if start <= t < end)
+        return points
+
+
+# Local time-series store fed with decoded readings. Keeps compressed raw
+# columns for recent history and incrementally maintained min/max/mean/last
+# rollups at each resolution in ROLLUPS, so range queries are answered from
+# a handful of buckets instead of raw samples. Rollups are fixed-size
+# array columns (about 5.5 MB per series with the default ROLLUPS), so memory
+# does not grow with time.
+class HistoryStore:
+    def __init__(self, fields=HISTORY_FIELDS, rollups=ROLLUPS, raw_chunks=16):
+        self.fields = tuple(fields)
+        self.rollups = tuple(rollups)
+        self.raw_chunks = raw_chunks
+        self.raw = {}
+        self.buckets = {}
+        # Local day of the last sample as (start, end, bucket number), to
+        # skip the timezone conversion for the day buckets
+        self._day = (0, 0, 0)
+        self._lock = threading.Lock()
+
+    # Add one decoded reading (a Reading) for a series
+    def add(self, series, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            raw = self.raw.get(series)
+            if raw is None:
+                raw = self.raw[series] = _RawColumns(self.fields, self.raw_chunks)
+                for resolution, retention in self.rollups:
+                    self.buckets[series, resolution] = _Rollup(len(self.fields), retention // resolution)
+            raw.append(timestamp, data)
+            values = [getattr(data, field) for field in self.fields]
+
+            for resolution, _ in self.rollups:
+                if resolution == DAY:
+                    if not self._day[0] <= timestamp < self._day[1]:
+                        number = _bucket_number(timestamp, DAY)
+                        self._day = (_bucket_time(number, DAY), _bucket_time(number + 1, DAY), number)
+                    number = self._day[2]
+                else:
+                    number = int(timestamp // resolution)
+                self.buckets[series, resolution].add(number, values)
+
+    def series(self):
+        with self._lock:
+            return sorted(self.raw)
+
+    # Pick the finest rollup that still holds `start` and answers the range
+    # in at most max_points buckets
+    def choose_resolution(self, start, end, max_points=1000, now=None):
+        if now is None:
+            now = time.time()
+        for resolution, retention in self.rollups:
+            if start >= now - retention and (end - start) / resolution <= max_points:
+                return resolution
+        return self.rollups[-1][0]
+
+    # Rolled-up points for start <= t < end as a list of
+    # {'time', 'min', 'max', 'mean', 'last'} dicts. The columns are copied
+    # under the lock and walked outside it, so a long range never holds up add().
+    def query(self, series, field, start, end, resolution=None):
+        if resolution is None:
+            resolution = self.choose_resolution(start, end)
+        index = self.fields.index(field)
+        with self._lock:
+            rollup = self.buckets.get((series, resolution))
+            if rollup is None:
+                raise KeyError(f"No {resolution}s history for {series}")
+            numbers, counts, mins, maxs, sums, lasts = rollup.snapshot(index)
+        size = rollup.size
+        last = _bucket_number(end, resolution)
+        if _bucket_time(last, resolution) >= end:
+            last -= 1
+        points = []
+        # Only the newest `size` buckets can still be held
+        for number in range(max(_bucket_number(start, resolution), last - size + 1), last + 1):
+            slot = number % size
+            if numbers[slot] != number:
+                continue
+            points.append({
+                'time': _bucket_time(number, resolution),
+                'min': mins[slot],
+                'max': maxs[slot],
+                'mean': sums[slot] / counts[slot],
+                'last': lasts[slot],
+            })
+        return points
+
+    # Raw (timestamp, value) samples still held for start <= t < end
+    def query_raw(self, series, field, start, end):
+        with self._lock:
+            raw = self.raw.get(series)
+            return [] if raw is None else raw.range(field, start, end)
+
+
+# Request handling for serve(), mixed into BaseHTTPRequestHandler there
+class _HistoryHandler:
+    store = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/series':
+                body = self.store.series()
+            elif url.path == '/query':
+                end = float(params.get('end', time.time()))
+                start = float(params.get('start', end - 86400))
+                resolution = int(params['resolution']) if 'resolution' in params else None
+                body = self.store.query(params['series'], params['field'], start, end, resolution)
+            else:
+                self.send_error(404)
+                return
+        except (KeyError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve the store on a loopback HTTP endpoint in a background thread:
+#   GET /series
+#   GET /query?series=...&field=...&start=...&end=...[&resolution=...]
+def serve(store, host='127.0.0.1', port=8124):
+    # Imported here so using the store does not load the HTTP server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    handler = type('HistoryHandler', (_HistoryHandler, BaseHTTPRequestHandler), {'store': store})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mppt-history', daemon=True).start()
+    return server
@@ -0,0 +1,176 @@
+import bisect
+import heapq
+import math
+import mmap
+import os
+import struct
+import time
+
+from mppt_decoder import FRAME_LENGTH, decode_frame, validate_checksum
+
+# Fixed-size journal record: timestamp (seconds since the epoch), port id,
+# charger address, flags and the raw 93-byte response frame = 105 bytes
+RECORD = struct.Struct(f'<dHBB{FRAME_LENGTH}s')
+RECORD_SIZE = RECORD.size
+_TIMESTAMP = struct.Struct('<d')
+
+FLAG_CHECKSUM_OK = 0x01
+
+SEGMENT_SUFFIX = '.mppt'
+
+
+# Start time of the segment holding `timestamp`
+def segment_start(timestamp, segment_seconds):
+    return int(timestamp // segment_seconds) * segment_seconds
+
+
+# Bounded time ranges spanning more segments than this are found by
+# listing the journal directory instead of looking up every segment name
+MAX_LOOKUPS = 256
+
+
+# Segment file of a writer. Named writers (one per supervisor worker) write
+# at the same time, so their files for a segment go in a directory named
+# after the segment start; either way a time maps directly to its files.
+def segment_path(directory, start, name=None):
+    if name is None:
+        return os.path.join(directory, f'{start:010d}{SEGMENT_SUFFIX}')
+    return os.path.join(directory, f'{start:010d}', f'{name}{SEGMENT_SUFFIX}')
+
+
+# Append-only journal of raw response frames, split into one segment file
+# per `segment_seconds` so any point in time maps directly to its file.
+# Records must be appended in time order; processes writing concurrently
+# each use their own `name`.
+class JournalWriter:
+    def __init__(self, directory, segment_seconds=3600, name=None):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.name = name
+        self._file = None
+        self._segment = None
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, port, address, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        start = segment_start(timestamp, self.segment_seconds)
+        if start != self._segment:
+            self._rotate(start)
+        flags = FLAG_CHECKSUM_OK if len(frame) == FRAME_LENGTH and validate_checksum(frame) else 0
+        self._file.write(RECORD.pack(timestamp, port, address, flags, bytes(frame)))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._segment = None
+
+    def _rotate(self, start):
+        self.close()
+        path = segment_path(self.directory, start, self.name)
+        if self.name is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'ab')
+        # Drop a partial record left behind by a crash so records stay aligned
+        size = self._file.tell()
+        if size % RECORD_SIZE:
+            self._file.truncate(size - size % RECORD_SIZE)
+        self._segment = start
+
+
+# Timestamps of a memory-mapped segment, indexable for bisect
+class _Timestamps:
+    def __init__(self, buffer, count):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return _TIMESTAMP.unpack_from(self.buffer, index * RECORD_SIZE)[0]
+
+
+# Reads journal segments through mmap, so a time range is located by
+# segment name and binary search without loading whole files into memory
+class JournalReader:
+    def __init__(self, directory, segment_seconds=3600):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+
+    # Segment files in time order, as a list of paths per segment start
+    # (one per writer that was active then). The segments of a bounded range
+    # are looked up by name; an open range lists the directory to find where
+    # the journal begins or ends.
+    def segments(self, start=None, end=None):
+        if start is not None:
+            first = segment_start(start, self.segment_seconds)
+        if start is not None and end is not None and (end - first) / self.segment_seconds <= MAX_LOOKUPS:
+            starts = range(first, math.ceil(end), self.segment_seconds)
+        else:
+            starts = self._starts()
+            if start is not None:
+                starts = [s for s in starts if s >= first]
+            if end is not None:
+                starts = [s for s in starts if s < end]
+        segments = []
+        for segment in starts:
+            paths = self._paths(segment)
+            if paths:
+                segments.append(paths)
+        return segments
+
+    # Start of every segment in the directory, sorted
+    def _starts(self):
+        starts = set()
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                name = name[:-len(SEGMENT_SUFFIX)]
+            if name.isdigit():
+                starts.add(int(name))
+        return sorted(starts)
+
+    # Files of one segment: the unnamed writer's and those of named writers
+    def _paths(self, start):
+        paths = []
+        path = segment_path(self.directory, start)
+        if os.path.exists(path):
+            paths.append(path)
+        folder = os.path.join(self.directory, f'{start:010d}')
+        try:
+            names = sorted(os.listdir(folder))
+        except FileNotFoundError:
+            return paths
+        paths.extend(os.path.join(folder, name) for name in names if name.endswith(SEGMENT_SUFFIX))
+        return paths
+
+    # Yield (timestamp, port, address, flags, frame) for start <= timestamp < end,
+    # merging the files of concurrent writers by timestamp
+    def records(self, start=None, end=None):
+        for paths in self.segments(start, end):
+            if len(paths) == 1:
+                yield from self._records(paths[0], start, end)
+            else:
+                yield from heapq.merge(*(self._records(path, start, end) for path in paths))
+
+    def _records(self, path, start, end):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // RECORD_SIZE
+            if not count:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                timestamps = _Timestamps(buffer, count)
+                first = 0 if start is None else bisect.bisect_left(timestamps, start)
+                last = count if end is None else bisect.bisect_left(timestamps, end)
+                for index in range(first, last):
+                    yield RECORD.unpack_from(buffer, index * RECORD_SIZE)
+
+    # Re-decode a time range through the current decoder, yielding
+    # (timestamp, port, address, Reading); frames with a bad checksum are skipped
+    def decode(self, start=None, end=None):
+        for timestamp, port, address, flags, frame in self.records(start, end):
+            if flags & FLAG_CHECKSUM_OK:
+                yield timestamp, port, address, decode_frame(frame)
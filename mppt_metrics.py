@@ -0,0 +1,218 @@
+import bisect
+import threading
+
+# Minimal Prometheus/OpenMetrics instrumentation. Metrics keep plain dicts
+# keyed by label value, so recording a sample is an uncontended lock and a
+# dict update (well under a microsecond); formatting happens only on scrape.
+# Per-charger metrics are labelled with the port setting as configured
+# (serial device or tcp:// gateway) and the charger address, since
+# addresses repeat across buses.
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _label_values(labels, key):
+    if not labels:
+        return ()
+    return key if len(labels) > 1 else (key,)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    # `key` is the label value (a tuple when there are several labels)
+    def inc(self, key=None, amount=1):
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    # Values recorded since the last take(), and start over
+    def take(self):
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+    # Add values taken from the same metric in another process
+    def merge(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield f'{self.name}_total', _format_labels(self.labels, _label_values(self.labels, key)), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, key=None, value=0):
+        self.values[key] = value
+
+    def merge(self, values):
+        with self._lock:
+            self.values.update(values)
+
+    def samples(self):
+        with self._lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labels, _label_values(self.labels, key)), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [count per bucket (last is +Inf), sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key=None, value=0.0):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def take(self):
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                entry = self.values.get(key)
+                if entry is None:
+                    self.values[key] = [list(counts), total]
+                    continue
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+        for key, counts, total in values:
+            values = _label_values(self.labels, key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket', _format_labels(self.labels, values, f'le="{le}"'), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labels, values), total
+            yield f'{self.name}_count', _format_labels(self.labels, values), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # {metric name: values} recorded since the last take(), for handing a
+    # worker process's metrics to the process that serves them
+    def take(self):
+        taken = {}
+        for metric in self.metrics:
+            values = metric.take()
+            if values:
+                taken[metric.name] = values
+        return taken
+
+    def merge(self, taken):
+        for metric in self.metrics:
+            values = taken.get(metric.name)
+            if values:
+                metric.merge(values)
+
+    # Text exposition format
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.5, 5.0)
+
+SERIAL_ROUND_TRIP = REGISTRY.register(Histogram(
+    'mppt_serial_round_trip_seconds', 'Time from sending a query to a valid response.',
+    _LATENCY_BUCKETS, ('port', 'address')))
+HA_POST_LATENCY = REGISTRY.register(Histogram(
+    'mppt_ha_post_seconds', 'Latency of Home Assistant state updates.', _LATENCY_BUCKETS))
+BAD_CHECKSUMS = REGISTRY.register(Counter(
+    'mppt_bad_checksums', 'Frames discarded because of a bad checksum.', ('port', 'address')))
+SHORT_READS = REGISTRY.register(Counter(
+    'mppt_short_reads', 'Query attempts that timed out without a complete frame.', ('port', 'address')))
+RETRIES = REGISTRY.register(Counter(
+    'mppt_retries', 'Queries re-sent after a failed attempt.', ('port', 'address')))
+FAILED_QUERIES = REGISTRY.register(Counter(
+    'mppt_failed_queries', 'Queries that got no valid response after all attempts.', ('port', 'address')))
+FAILED_POSTS = REGISTRY.register(Counter(
+    'mppt_failed_posts', 'Home Assistant updates that failed.', ('sensor',)))
+LAST_GOOD = REGISTRY.register(Gauge(
+    'mppt_last_good_timestamp_seconds', 'Unix time of the last valid response.', ('port', 'address')))
+CYCLE_DURATION = REGISTRY.register(Gauge(
+    'mppt_cycle_duration_seconds', 'Duration of the last polling cycle.', ('port',)))
+FAULT_EVENTS = REGISTRY.register(Counter(
+    'mppt_fault_events', 'Debounced fault and anomaly conditions that became active.', ('condition',)))
+OUTBOX_DEPTH = REGISTRY.register(Gauge(
+    'mppt_outbox_depth', 'Updates waiting for Home Assistant: latest-value entities and backlog bytes.',
+    ('queue',)))
+
+
+# Request handling for serve(), mixed into BaseHTTPRequestHandler there
+class _MetricsHandler:
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        payload = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics in a background thread
+def serve(registry=REGISTRY, host='127.0.0.1', port=9105):
+    # Imported here so recording metrics does not load the HTTP server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    handler = type('MetricsHandler', (_MetricsHandler, BaseHTTPRequestHandler), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mppt-metrics', daemon=True).start()
+    return server
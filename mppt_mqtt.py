@@ -0,0 +1,121 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from mppt_metrics import FAILED_POSTS, HA_POST_LATENCY
+
+
+# Publishes sensor states to Home Assistant through an MQTT broker.
+# Each entity is announced once with an MQTT discovery config; after that a
+# whole cycle of updates goes out as a single retained JSON message on one
+# state topic, which every entity reads its value from with a template.
+# Connecting happens in the background and is retried every `reconnect_min`
+# seconds, doubling up to `reconnect_max`, so a broker that is down only
+# shows up as failed publishes (which the outbox retries).
+# Drop-in alternative to mppt_publisher.HomeAssistantPublisher.
+class MqttPublisher:
+    def __init__(self, host, port=1883, username=None, password=None, discovery_prefix='homeassistant',
+                 base_topic='mppt', timeout=5, latency_window=1000, reconnect_min=1, reconnect_max=60):
+        self.discovery_prefix = discovery_prefix
+        self.state_topic = f'{base_topic}/state'
+        self.timeout = timeout
+        self.announced = set()
+        self.snapshot = {}
+
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f'{base_topic}-publisher')
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.reconnect_delay_set(min_delay=reconnect_min, max_delay=reconnect_max)
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logging.error(f"MQTT broker refused the connection: {reason_code}")
+            return
+        logging.info("Connected to the MQTT broker")
+        # Announce again in case the broker lost the retained configs. Not
+        # under the lock: publish() holds it while waiting on this thread.
+        self.announced = set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        logging.warning(f"Disconnected from the MQTT broker: {reason_code}")
+
+    def post_state(self, sensor_name, state):
+        return not self.publish({sensor_name: state})
+
+    # Publish {sensor_name: state} as one batch.
+    # Returns the names of the sensors that failed to update.
+    def publish(self, states):
+        start_time = time.perf_counter()
+        with self._lock:
+            try:
+                if not self.client.is_connected():
+                    raise ConnectionError("not connected to the MQTT broker")
+                for sensor_name, state in states.items():
+                    component, object_id = sensor_name.split('.', 1)
+                    if object_id not in self.announced:
+                        self._announce(component, object_id, state['attributes'])
+                    self.snapshot[object_id] = state['state']
+                info = self.client.publish(self.state_topic, json.dumps(self.snapshot), qos=1, retain=True)
+                info.wait_for_publish(self.timeout)
+                ok = info.is_published()
+                if not ok:
+                    logging.error(f"Failed to publish {len(states)} sensors to {self.state_topic}")
+            except (OSError, RuntimeError, ValueError) as e:
+                logging.error(f"Failed to publish {len(states)} sensors to {self.state_topic}: {e}")
+                ok = False
+            latency = time.perf_counter() - start_time
+            self.requests += 1
+            self.failures += not ok
+            self.latencies.append(latency)
+        HA_POST_LATENCY.observe(None, latency)
+        if not ok:
+            # Re-announce on the next publish in case the broker lost the configs
+            for sensor_name in states:
+                FAILED_POSTS.inc(sensor_name)
+                self.announced.discard(sensor_name.split('.', 1)[-1])
+            return list(states)
+        return []
+
+    def _announce(self, component, object_id, attributes):
+        config = {
+            'name': attributes.get('friendly_name', object_id),
+            'unique_id': object_id,
+            'object_id': object_id,
+            'state_topic': self.state_topic,
+            'value_template': f'{{{{ value_json.{object_id} }}}}',
+        }
+        for key in ('unit_of_measurement', 'device_class', 'state_class'):
+            if attributes.get(key):
+                config[key] = attributes[key]
+        if component == 'binary_sensor':
+            config['payload_on'] = 'on'
+            config['payload_off'] = 'off'
+        topic = f'{self.discovery_prefix}/{component}/{object_id}/config'
+        self.client.publish(topic, json.dumps(config), qos=1, retain=True)
+        self.announced.add(object_id)
+
+    # Batch counters and latency percentiles (seconds) over the recent window
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {'requests': self.requests, 'failures': self.failures}
+        for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            stats[name] = latencies[int(fraction * (len(latencies) - 1))] if latencies else None
+        return stats
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
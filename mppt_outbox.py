@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from mppt_metrics import OUTBOX_DEPTH
+
+# Energy counters whose every value is worth delivering, not just the latest
+BACKLOG_STATE_CLASSES = ('total', 'total_increasing')
+
+
+# Store-and-forward queue between decoding and publishing. `put` never
+# blocks on Home Assistant: states are handed to a drain thread that
+# delivers them through `publisher` (a HomeAssistantPublisher or
+# MqttPublisher) and retries failures with exponential backoff between
+# `retry_min` and `retry_max` seconds.
+#
+# While updates are pending, ordinary sensors are coalesced to their latest
+# value, so memory is bounded by the number of entities. Energy counters
+# keep every value: once a delivery has failed they are appended to a JSON
+# lines backlog file at `path` and replayed in order when Home Assistant is
+# back. The backlog is capped at `max_backlog_bytes` by dropping its oldest
+# entries; a restart replays whatever was not yet truncated, which is
+# harmless for counters.
+class Outbox:
+    def __init__(self, publisher, path, max_backlog_bytes=16 * 1024 * 1024, retry_min=1.0, retry_max=300.0,
+                 batch_size=100):
+        self.publisher = publisher
+        self.path = path
+        self.max_backlog_bytes = max_backlog_bytes
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.batch_size = batch_size
+        self.pending = {}
+        self.healthy = True
+        self.delay = retry_min
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        self._backlog = open(path, 'ab')
+        self._offset = 0
+        self._backlog_size = self._backlog.tell()
+        # Bumped whenever the backlog file is rewritten under the drain thread
+        self._generation = 0
+        if self._backlog_size:
+            self._drop_partial_line()
+            self._wake.set()
+        self._thread = threading.Thread(target=self._drain_loop, name='mppt-outbox', daemon=True)
+        self._thread.start()
+
+    # Queue a batch of {sensor_name: state} for delivery
+    def put(self, states, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if self.healthy and self._backlog_size == 0:
+                self.pending.update(states)
+            else:
+                counters = {name: state for name, state in states.items() if self._is_counter(state)}
+                if counters:
+                    self._append_backlog(timestamp, counters)
+                for name, state in states.items():
+                    if name not in counters:
+                        self.pending[name] = state
+            self._update_depth()
+        self._wake.set()
+
+    # Drop a partial entry left behind by a crash so entries stay line-aligned
+    def _drop_partial_line(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            self._backlog.truncate(end)
+            self._backlog_size = end
+
+    @staticmethod
+    def _is_counter(state):
+        return state.get('attributes', {}).get('state_class') in BACKLOG_STATE_CLASSES
+
+    def _append_backlog(self, timestamp, states):
+        line = json.dumps({'time': timestamp, 'states': states}, separators=(',', ':')).encode() + b'\n'
+        self._backlog.write(line)
+        self._backlog.flush()
+        self._backlog_size += len(line)
+        if self._backlog_size - self._offset > self.max_backlog_bytes:
+            self._compact(self.max_backlog_bytes // 2)
+
+    # Rewrite the backlog keeping only the newest `keep` bytes of unsent entries
+    def _compact(self, keep):
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            lines = f.readlines()
+        kept = []
+        size = 0
+        for line in reversed(lines):
+            if size + len(line) > keep:
+                break
+            kept.append(line)
+            size += len(line)
+        logging.warning(f"Outbox backlog is full, dropping {len(lines) - len(kept)} oldest entries")
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'wb') as f:
+            f.writelines(reversed(kept))
+        self._backlog.close()
+        os.replace(temporary, self.path)
+        self._backlog = open(self.path, 'ab')
+        self._offset = 0
+        self._backlog_size = size
+        self._generation += 1
+
+    def _read_backlog(self):
+        with self._lock:
+            if self._offset >= self._backlog_size:
+                return [], self._generation
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                lines = [f.readline() for _ in range(self.batch_size)]
+            return [line for line in lines if line], self._generation
+
+    def _drain_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while not self._stop.is_set() and not self._drain_once():
+                logging.warning(f"Home Assistant unavailable, retrying in {self.delay} seconds")
+                self._stop.wait(self.delay)
+                self.delay = min(self.delay * 2, self.retry_max)
+
+    # Deliver the backlog (oldest first), then the latest values.
+    # Returns False if anything failed.
+    def _drain_once(self):
+        while True:
+            lines, generation = self._read_backlog()
+            if not lines:
+                break
+            for line in lines:
+                if self.publisher.publish(json.loads(line)['states']):
+                    with self._lock:
+                        self.healthy = False
+                    return False
+                with self._lock:
+                    if generation != self._generation:
+                        # Compacted meanwhile: re-read from the new start
+                        break
+                    self._offset += len(line)
+                    if self._offset >= self._backlog_size:
+                        self._backlog.truncate(0)
+                        self._offset = self._backlog_size = 0
+                    self._update_depth()
+
+        with self._lock:
+            states, self.pending = self.pending, {}
+        if not states:
+            self._recovered()
+            return True
+        failed = self.publisher.publish(states)
+        with self._lock:
+            if failed:
+                for name in failed:
+                    # Keep a newer value queued since
+                    self.pending.setdefault(name, states[name])
+                # Pending counters are older than anything put from now on,
+                # so they go to the backlog first to keep their order
+                counters = {name: state for name, state in self.pending.items() if self._is_counter(state)}
+                if counters:
+                    self._append_backlog(time.time(), counters)
+                    for name in counters:
+                        del self.pending[name]
+                self.healthy = False
+            self._update_depth()
+        if failed:
+            return False
+        self._recovered()
+        return True
+
+    def _recovered(self):
+        with self._lock:
+            if not self.healthy:
+                logging.warning("Home Assistant is reachable again")
+            self.healthy = True
+        self.delay = self.retry_min
+
+    def _update_depth(self):
+        OUTBOX_DEPTH.set('latest', len(self.pending))
+        OUTBOX_DEPTH.set('backlog_bytes', self._backlog_size - self._offset)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._backlog.close()
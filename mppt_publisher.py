@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from mppt_metrics import FAILED_POSTS, HA_POST_LATENCY
+
+
+# Minimum change before a field is re-published: absolute in the field's
+# unit, relative as a fraction of the last published value. None disables.
+Deadband = namedtuple('Deadband', 'absolute relative', defaults=(None, None))
+
+
+# Remembers the last value published per entity and decides whether a new
+# value is worth sending: it must differ (beyond the field's deadband, if
+# any) or the entity must not have been published for `heartbeat` seconds.
+class ChangeFilter:
+    def __init__(self, deadbands=None, heartbeat=60):
+        self.deadbands = deadbands or {}
+        self.heartbeat = heartbeat
+        self.last = {}
+
+    def should_publish(self, entity, field, value, now=None):
+        if now is None:
+            now = time.monotonic()
+        previous = self.last.get(entity)
+        if previous is not None:
+            last_value, last_time = previous
+            if now - last_time < self.heartbeat and not self._changed(field, last_value, value):
+                return False
+        self.last[entity] = (value, now)
+        return True
+
+    # Drop the cached value so the next reading is published regardless
+    def forget(self, entity):
+        self.last.pop(entity, None)
+
+    def _changed(self, field, old, new):
+        deadband = self.deadbands.get(field)
+        if deadband is None or not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+            return new != old
+        delta = abs(new - old)
+        if deadband.absolute is not None and delta >= deadband.absolute:
+            return True
+        # Strictly greater, so an unchanged zero never counts as a relative change
+        if deadband.relative is not None and delta > deadband.relative * abs(old):
+            return True
+        return False
+
+
+# Publishes sensor states to the Home Assistant REST API over one
+# keep-alive requests.Session with a bounded connection pool, using a fixed
+# pool of worker threads instead of a new thread and TCP connection per post.
+class HomeAssistantPublisher:
+    def __init__(self, url, token, workers=4, timeout=5, latency_window=1000):
+        # Imported here so the change filter can be used without loading requests
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ha-publisher')
+        self._request_error = requests.RequestException
+
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+    # Post a single sensor state; returns True on success
+    def post_state(self, sensor_name, state):
+        start_time = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.post(f"{self.url}/api/states/{sensor_name}", json=state, timeout=self.timeout)
+            ok = response.status_code in (200, 201)
+            if not ok:
+                logging.error(f"Failed to update sensor {sensor_name}: {response.status_code} - {response.text}")
+        except self._request_error as e:
+            logging.error(f"Failed to update sensor {sensor_name}: {e}")
+        finally:
+            latency = time.perf_counter() - start_time
+            HA_POST_LATENCY.observe(None, latency)
+            if not ok:
+                FAILED_POSTS.inc(sensor_name)
+            with self._lock:
+                self.requests += 1
+                self.failures += not ok
+                self.latencies.append(latency)
+        return ok
+
+    # Post {sensor_name: state} on the worker pool and wait for all of them.
+    # Returns the names of the sensors that failed to update.
+    def publish(self, states):
+        futures = {name: self.executor.submit(self.post_state, name, state) for name, state in states.items()}
+        wait(futures.values())
+        return [name for name, future in futures.items() if not future.result()]
+
+    # Request counters and latency percentiles (seconds) over the recent window
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = {'requests': self.requests, 'failures': self.failures}
+        for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            stats[name] = latencies[int(fraction * (len(latencies) - 1))] if latencies else None
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,250 @@
+import argparse
+import math
+import os
+import random
+import struct
+import threading
+import time
+import tty
+
+from mppt_bus import transfer_time
+from mppt_decoder import COMMAND_QUERY_ALL_DATA, FIELDS_BY_NAME, FRAME_LENGTH, calculate_checksum
+
+# Sample 0xB1 response from scratch_notes.txt, used as the frame template
+SAMPLE_FRAME = bytes.fromhex(
+    '01b101000d000001030404040104000012c016a8164510680fa00fa00fa0046d14b002420139'
+    '0000006a0000000002a0000f16d701011388190016a8000a0012000100020108000000010000'
+    '00050000000803000000000000000000ad'
+)
+COMMAND_LENGTH = 8
+
+# Charging status bits
+_CHARGING = 0x01
+_TRACKING = 0x04
+_FLOATING = 0x08
+
+
+# Write a scaled value into a frame at its field's offset
+def _put(frame, name, value):
+    field = FIELDS_BY_NAME[name]
+    raw = round(value * field.divisor) if field.divisor else int(value)
+    struct.pack_into('>' + field.fmt, frame, field.offset, raw)
+
+
+# One simulated charger with plausible evolving PV, battery and energy values.
+# The solar day is driven by the wall clock (scaled by `time_scale`) so that
+# runs show day/night transitions, charge phases and growing kWh counters.
+class SimulatedCharger:
+    def __init__(self, address, peak_current=30.0, time_scale=1.0, seed=None, clock=time.time):
+        self.address = address
+        self.peak_current = peak_current
+        self.time_scale = time_scale
+        self.clock = clock
+        self.random = random.Random(address if seed is None else seed)
+        self.started = clock()
+        self.battery_voltage = 51.0 + self.random.uniform(-1, 1)
+        self.total_wh = 900000.0 + self.random.uniform(0, 100000)
+        self.today_wh = 0.0
+        self.day = None
+        self.last = None
+
+    def _sim_time(self, now):
+        return self.started + (now - self.started) * self.time_scale
+
+    def frame(self, now=None):
+        if now is None:
+            now = self.clock()
+        sim_now = self._sim_time(now)
+        local = time.localtime(sim_now)
+        hour = local.tm_hour + local.tm_min / 60 + local.tm_sec / 3600
+
+        # Half-sine irradiance between 06:00 and 18:00 with some cloud noise
+        sun = max(0.0, math.sin((hour - 6) / 12 * math.pi))
+        sun *= 1 - 0.3 * self.random.random() * self.random.random()
+        pv_voltage = (95 + 25 * sun + self.random.uniform(-1, 1)) if sun > 0 else self.random.uniform(0, 2)
+
+        float_voltage = 57.0
+        floating = self.battery_voltage >= float_voltage
+        current = self.peak_current * sun * (0.15 if floating else 1.0)
+        current = max(0.0, current + self.random.uniform(-0.05, 0.05)) if sun > 0 else 0.0
+
+        elapsed = 0.0 if self.last is None else (sim_now - self.last)
+        self.last = sim_now
+        # Battery drifts up while charging and sags slowly under load
+        self.battery_voltage += (current * 0.00005 - 0.0002) * elapsed
+        self.battery_voltage = min(max(self.battery_voltage, 46.0), float_voltage + 0.1)
+        energy = current * self.battery_voltage * elapsed / 3600
+        if self.day != local.tm_yday:
+            self.day = local.tm_yday
+            self.today_wh = 0.0
+        self.today_wh += energy
+        self.total_wh += energy
+
+        status = 0
+        if current > 0:
+            status |= _CHARGING | (_FLOATING if floating else _TRACKING)
+
+        frame = bytearray(SAMPLE_FRAME)
+        frame[0] = self.address
+        frame[4] = status
+        frame[12] = self.address
+        _put(frame, 'pv_voltage_in', pv_voltage)
+        _put(frame, 'battery_voltage', self.battery_voltage)
+        _put(frame, 'charging_current', current)
+        _put(frame, 'int_temp', 25 + 15 * sun + self.random.uniform(-0.2, 0.2))
+        _put(frame, 'ext_temp', 15 + 5 * sun)
+        struct.pack_into('>I', frame, FIELDS_BY_NAME['power_generated_today'].offset, int(self.today_wh))
+        struct.pack_into('>I', frame, FIELDS_BY_NAME['total_kwh_generated'].offset, int(self.total_wh))
+        frame[FRAME_LENGTH - 1] = calculate_checksum(frame[:FRAME_LENGTH - 1])
+        return bytes(frame)
+
+
+# A bus of simulated chargers answering 0xB1 queries, with optional
+# response latency, dropped bytes and corrupted checksums
+class Simulator:
+    def __init__(self, addresses, baud_rate=9600, latency=0.0, drop_rate=0.0, corrupt_rate=0.0,
+                 time_scale=1.0, seed=None):
+        self.chargers = {
+            address: SimulatedCharger(address, time_scale=time_scale, seed=None if seed is None else seed + address)
+            for address in addresses
+        }
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.random = random.Random(seed)
+        self.responses = 0
+
+    # Response bytes for one 8-byte command, or None if nobody answers
+    def respond(self, command):
+        if len(command) != COMMAND_LENGTH or command[1] != COMMAND_QUERY_ALL_DATA:
+            return None
+        if calculate_checksum(command[:COMMAND_LENGTH - 1]) != command[COMMAND_LENGTH - 1]:
+            return None
+        charger = self.chargers.get(command[0])
+        if charger is None:
+            return None
+
+        frame = bytearray(charger.frame())
+        if self.corrupt_rate and self.random.random() < self.corrupt_rate:
+            frame[FRAME_LENGTH - 1] ^= 0xFF
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            del frame[self.random.randrange(len(frame))]
+        self.responses += 1
+        return bytes(frame)
+
+    # Split an incoming byte stream into commands, resyncing on bad checksums
+    def commands(self, buffer):
+        while len(buffer) >= COMMAND_LENGTH:
+            if calculate_checksum(buffer[:COMMAND_LENGTH - 1]) == buffer[COMMAND_LENGTH - 1]:
+                command = bytes(buffer[:COMMAND_LENGTH])
+                del buffer[:COMMAND_LENGTH]
+                yield command
+            else:
+                del buffer[0]
+
+    # Seconds the bus is busy answering `response`, including the command
+    def wire_time(self, response):
+        return self.latency + transfer_time(COMMAND_LENGTH + len(response), self.baud_rate)
+
+
+# In-process serial port backed by a Simulator. Implements the transport
+# API the pollers use (write, read with an optional timeout,
+# reset_input_buffer, in_waiting) and paces replies by the baud rate
+# without needing a pty.
+class SimulatedPort:
+    def __init__(self, simulator, timeout=1.0, pace=True):
+        self.simulator = simulator
+        self.timeout = timeout
+        self.pace = pace
+        self._pending = bytearray()
+        self._rx = bytearray()
+        self._ready_at = 0.0
+
+    def write(self, data):
+        self._pending += data
+        for command in self.simulator.commands(self._pending):
+            response = self.simulator.respond(command)
+            if response:
+                self._rx += response
+                if self.pace:
+                    self._ready_at = max(self._ready_at, time.monotonic()) + self.simulator.wire_time(response)
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self._rx) if time.monotonic() >= self._ready_at else 0
+
+    def read(self, size=1, timeout=None):
+        now = time.monotonic()
+        deadline = now + ((self.timeout if timeout is None else timeout) or 0)
+        if self._ready_at > now:
+            time.sleep(max(0.0, min(self._ready_at, deadline) - now))
+            if time.monotonic() < self._ready_at:
+                return b''
+        if not self._rx:
+            # Nothing more will arrive until the next write, so time out
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            return b''
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Serve the simulator on a pty pair in a background thread and return the
+# path of the slave side, usable as SERIAL_PORT by the real scripts
+def start_pty(simulator, pace=True):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def serve():
+        buffer = bytearray()
+        while True:
+            try:
+                buffer += os.read(master, 256)
+            except OSError:
+                return
+            for command in simulator.commands(buffer):
+                response = simulator.respond(command)
+                if response is None:
+                    continue
+                if pace:
+                    time.sleep(simulator.wire_time(response))
+                os.write(master, response)
+
+    threading.Thread(target=serve, name='mppt-simulator', daemon=True).start()
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulated MPPT chargers on a virtual serial port.')
+    parser.add_argument('--chargers', type=int, default=2, help='Number of chargers (addresses 1..N)')
+    parser.add_argument('--baud', type=int, default=9600, help='Baud rate used for pacing')
+    parser.add_argument('--latency', type=float, default=0.0, help='Extra response latency in seconds')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of frames missing a byte')
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help='Fraction of frames with a bad checksum')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='Simulated seconds per real second')
+    parser.add_argument('--no-pace', action='store_true', help='Answer immediately instead of at wire speed')
+    args = parser.parse_args()
+
+    simulator = Simulator(range(1, args.chargers + 1), args.baud, args.latency, args.drop_rate,
+                          args.corrupt_rate, args.time_scale)
+    print(f"Simulating {args.chargers} chargers on {start_pty(simulator, not args.no_pace)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,137 @@
+import logging
+import time
+
+from mppt_decoder import COMMAND_QUERY_ALL_DATA, FRAME_LENGTH, validate_checksum
+from mppt_metrics import BAD_CHECKSUMS, FAILED_QUERIES, RETRIES, SHORT_READS
+
+
+# Incremental parser over a persistent receive buffer.
+# Bytes are fed in as they arrive; complete frames with a valid header and
+# checksum are handed out and anything in between is dropped, so the reader
+# resynchronises with the bus after a glitch instead of staying misaligned.
+class FrameAssembler:
+    def __init__(self, command_type=COMMAND_QUERY_ALL_DATA):
+        self.command_type = command_type
+        self.buffer = bytearray()
+        self.dropped_bytes = 0
+        self.bad_checksums = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    # Bytes still needed before the next frame could be complete
+    def needed(self):
+        return max(1, FRAME_LENGTH - len(self.buffer))
+
+    # Return the next complete frame from the buffer, or None if there is none
+    # yet. With an address, frames from other chargers are discarded.
+    def next_frame(self, address=None):
+        buffer = self.buffer
+        while True:
+            start = self._find_header(address)
+            if start is None:
+                # Keep the last byte, it may be the address of a header
+                # whose command byte has not arrived yet
+                self._drop(max(0, len(buffer) - 1))
+                return None
+            self._drop(start)
+            if len(buffer) < FRAME_LENGTH:
+                return None
+
+            frame = bytes(buffer[:FRAME_LENGTH])
+            if validate_checksum(frame):
+                del buffer[:FRAME_LENGTH]
+                return frame
+
+            # Not a real frame start (or a corrupted frame): skip past it and rescan
+            self.bad_checksums += 1
+            self._drop(1)
+
+    def clear(self):
+        self._drop(len(self.buffer))
+
+    def _find_header(self, address):
+        buffer = self.buffer
+        position = buffer.find(self.command_type, 1)
+        while position != -1:
+            if address is None or buffer[position - 1] == address:
+                return position - 1
+            position = buffer.find(self.command_type, position + 1)
+        return None
+
+    def _drop(self, count):
+        if count:
+            del self.buffer[:count]
+            self.dropped_bytes += count
+
+
+# Update the per-charger error counters after one query attempt;
+# `key` is the (port, address) metric label
+def count_attempt(assembler, key, bad_checksums_before, ok, will_retry):
+    bad_checksums = assembler.bad_checksums - bad_checksums_before
+    if bad_checksums:
+        BAD_CHECKSUMS.inc(key, bad_checksums)
+    if not ok:
+        if not bad_checksums:
+            SHORT_READS.inc(key)
+        if will_retry:
+            RETRIES.inc(key)
+
+
+# The query protocol of request_frame without the I/O, shared by the
+# blocking and asyncio pollers. Yields the command to write (bytes) or
+# (bytes wanted, seconds left) for a read, which is sent back what was read
+# (b'' or None when nothing arrived); returns the frame. `port` labels the
+# error counters.
+#
+# Before writing a command the driver discards whatever input is pending on
+# the port, and the assembler's buffer is cleared here: anything received
+# before the command went out is a late reply to an earlier attempt, and
+# taking it would leave the real reply in the buffer for the next poll.
+def request_steps(command, assembler, retries, timeout, port):
+    address = command[0]
+    key = (port, address)
+    for attempt in range(1, retries + 1):
+        bad_checksums = assembler.bad_checksums
+        assembler.clear()
+        yield command
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = assembler.next_frame(address)
+            if frame is not None:
+                count_attempt(assembler, key, bad_checksums, True, attempt < retries)
+                return frame
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            data = yield assembler.needed(), remaining
+            if data:
+                assembler.feed(data)
+        count_attempt(assembler, key, bad_checksums, False, attempt < retries)
+        logging.debug(f"No valid response from MPPT address {address} (attempt {attempt}/{retries})")
+    FAILED_QUERIES.inc(key)
+    raise TimeoutError(f"No valid response from MPPT address {address} after {retries} attempts")
+
+
+# Send a command and wait for the matching response frame over a transport
+# (see mppt_transport). Each attempt re-sends the command and waits up to
+# `timeout` seconds, with no read running past that deadline; after
+# `retries` failed attempts a TimeoutError is raised instead of looping forever.
+# Error counters are labelled with `port`, by default the transport's name.
+def request_frame(serial_port, command, assembler, retries=3, timeout=1.0, port=None):
+    if port is None:
+        port = str(serial_port)
+    steps = request_steps(command, assembler, retries, timeout, port)
+    data = None
+    try:
+        while True:
+            step = steps.send(data)
+            if isinstance(step, bytes):
+                serial_port.reset_input_buffer()
+                serial_port.write(step)
+                data = None
+            else:
+                size, remaining = step
+                data = serial_port.read(size, remaining)
+    except StopIteration as e:
+        return e.value
@@ -0,0 +1,240 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing.connection import wait
+
+from mppt_adaptive import AdaptivePolicy
+from mppt_bus import BusScheduler
+from mppt_decoder import decode_frame
+from mppt_journal import FLAG_CHECKSUM_OK, RECORD, JournalWriter
+from mppt_metrics import REGISTRY
+from mppt_transport import open_transport
+
+# Workers start from a fresh interpreter rather than a fork: the collector
+# already runs threads (publisher, outbox, HTTP servers) whose locks a fork
+# could copy while held. Everything a worker needs is passed as plain
+# arguments.
+_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+# Stands in for the journal inside a worker: BusScheduler hands it every
+# raw frame, which goes to the worker's own journal (if any) and is
+# collected so each completed cycle can be sent to the supervisor as one
+# message of packed journal records (105 bytes per reading)
+class _FrameSink:
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.records = bytearray()
+        self._lock = threading.Lock()
+
+    # Frames from request_frame have already passed the checksum
+    def append(self, port, address, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self.journal is not None:
+            self.journal.append(port, address, frame, timestamp)
+        with self._lock:
+            self.records += RECORD.pack(timestamp, port, address, FLAG_CHECKSUM_OK, bytes(frame))
+
+    def take(self):
+        with self._lock:
+            records, self.records = self.records, bytearray()
+        return bytes(records)
+
+
+# BusScheduler that stamps a shared heartbeat around every poll, so the
+# supervisor can tell a wedged adapter from a quiet bus, and flushes the
+# metrics of cycles that have nothing to publish (e.g. every poll failed)
+class _WorkerScheduler(BusScheduler):
+    def __init__(self, *args, heartbeat, flush, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.heartbeat = heartbeat
+        self.flush = flush
+
+    def run_cycle(self):
+        cycle = super().run_cycle()
+        if not cycle:
+            self.flush()
+        return cycle
+
+    def poll(self, address):
+        self.heartbeat.value = time.monotonic()
+        try:
+            return super().poll(address)
+        finally:
+            self.heartbeat.value = time.monotonic()
+
+
+# Entry point of a worker process: poll one serial port (or gateway) forever.
+# Each cycle is sent as (packed records, metrics recorded since the last
+# cycle); the worker journals its port to segment files of its own, since
+# records arriving from several workers are not in time order.
+def _worker(conn, heartbeat, port_id, port, addresses, baud_rate, retries, timeout, connect_timeout, adaptive,
+            journal_dir, log_level):
+    logging.basicConfig(level=log_level)
+    journal = JournalWriter(journal_dir, name=str(port_id)) if journal_dir else None
+    sink = _FrameSink(journal)
+    lock = threading.Lock()
+
+    def flush(cycle=None):
+        with lock:
+            records = sink.take()
+            metrics = REGISTRY.take()
+            if records or metrics:
+                conn.send((records, metrics))
+
+    with open_transport(port, baud_rate, timeout=timeout, connect_timeout=connect_timeout) as transport:
+        scheduler = _WorkerScheduler(transport, addresses, baud_rate, flush, retries=retries, timeout=timeout,
+                                     journal=sink, port_id=port_id, policy=AdaptivePolicy() if adaptive else None,
+                                     port=port, heartbeat=heartbeat, flush=flush)
+        scheduler.run()
+
+
+# One worker process and its end of the pipe
+class _Worker:
+    def __init__(self, port_id, port, addresses, timeout, connect_timeout):
+        self.port_id = port_id
+        self.port = port
+        self.addresses = list(addresses)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.process = None
+        self.conn = None
+        self.heartbeat = _CONTEXT.Value('d', 0.0, lock=False)
+        self.restarts = 0
+        self.restart_at = 0.0
+
+
+# Runs one worker process per serial port and collects their readings in
+# this process. Workers only poll, journal and forward raw frames with their
+# metrics; decoding for publishing, aggregation, Home Assistant updates and
+# /metrics happen here, so each
+# bus gets its own core and GIL. A worker that exits, or whose heartbeat is
+# older than `stall_timeout` (e.g. a wedged USB adapter), is killed and
+# restarted after `restart_delay` seconds, doubling up to `max_restart_delay`
+# while it keeps failing; the other buses are unaffected.
+#
+# `ports` is {serial port: addresses} and `port_settings` optionally
+# overrides `timeout` and `connect_timeout` per port as {port: {'timeout':
+# ..., 'connect_timeout': ...}}; `publish(port, cycle)` receives each
+# worker cycle as {address: data} on a separate thread behind a bounded
+# queue, so a slow publisher never backs up the workers' pipes.
+class Supervisor:
+    def __init__(self, ports, baud_rate, publish, retries=1, timeout=0.5, connect_timeout=3.0, port_settings=None,
+                 adaptive=True, journal_dir=None, queue_size=64, restart_delay=5.0, max_restart_delay=300.0,
+                 stall_timeout=120.0):
+        port_settings = port_settings or {}
+        self.workers = []
+        for port_id, (port, addresses) in enumerate(ports.items()):
+            settings = port_settings.get(port, {})
+            self.workers.append(_Worker(port_id, port, addresses, settings.get('timeout', timeout),
+                                        settings.get('connect_timeout', connect_timeout)))
+        self.baud_rate = baud_rate
+        self.publish = publish
+        self.retries = retries
+        self.adaptive = adaptive
+        self.journal_dir = journal_dir
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stall_timeout = stall_timeout
+        self.results = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._publisher = threading.Thread(target=self._publish_loop, name='mppt-publisher', daemon=True)
+
+    def _start(self, worker):
+        receiver, sender = _CONTEXT.Pipe(duplex=False)
+        worker.heartbeat.value = time.monotonic()
+        worker.process = _CONTEXT.Process(
+            target=_worker, name=f'mppt-worker-{worker.port_id}', daemon=True,
+            args=(sender, worker.heartbeat, worker.port_id, worker.port, worker.addresses,
+                  self.baud_rate, self.retries, worker.timeout, worker.connect_timeout, self.adaptive, self.journal_dir,
+                  logging.getLogger().level))
+        worker.process.start()
+        sender.close()
+        worker.conn = receiver
+        logging.info(f"Started worker {worker.process.pid} for {worker.port}")
+
+    def _stop_worker(self, worker):
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+        worker.conn = None
+        delay = min(self.restart_delay * 2 ** worker.restarts, self.max_restart_delay)
+        worker.restarts += 1
+        worker.restart_at = time.monotonic() + delay
+        logging.error(f"Worker for {worker.port} exited with code {worker.process.exitcode}, "
+                      f"restarting in {delay} seconds")
+
+    def run(self):
+        self._publisher.start()
+        for worker in self.workers:
+            self._start(worker)
+        try:
+            while not self._stop.is_set():
+                connections = {worker.conn: worker for worker in self.workers if worker.conn is not None}
+                for conn in wait(list(connections), timeout=1.0):
+                    self._receive(connections[conn])
+                self._check_workers()
+        finally:
+            for worker in self.workers:
+                if worker.process is not None and worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+
+    def stop(self):
+        self._stop.set()
+
+    def _receive(self, worker):
+        try:
+            records, metrics = worker.conn.recv()
+        except (EOFError, OSError):
+            self._stop_worker(worker)
+            return
+        REGISTRY.merge(metrics)
+        if not records:
+            return
+        # The worker is polling successfully again
+        worker.restarts = 0
+        cycle = {}
+        for timestamp, port_id, address, flags, frame in RECORD.iter_unpack(records):
+            cycle[address] = decode_frame(frame)
+        self._enqueue((worker.port, cycle))
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.conn is None:
+                if now >= worker.restart_at:
+                    self._start(worker)
+            elif not worker.process.is_alive():
+                self._stop_worker(worker)
+            elif now - worker.heartbeat.value > self.stall_timeout:
+                logging.error(f"Worker for {worker.port} has not polled for {self.stall_timeout} seconds")
+                self._stop_worker(worker)
+
+    def _enqueue(self, item):
+        while True:
+            try:
+                self.results.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.results.get_nowait()
+                    logging.warning("Publisher is behind, dropping the oldest cycle")
+                except queue.Empty:
+                    pass
+
+    def _publish_loop(self):
+        while not self._stop.is_set():
+            try:
+                port, cycle = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.publish(port, cycle)
+            except Exception as e:
+                logging.error(f"Error: {e}")
@@ -0,0 +1,215 @@
+import logging
+import socket
+import time
+from urllib.parse import urlparse
+
+import serial
+
+
+# Base for persistent byte transports with the pyserial-like semantics
+# request_frame relies on: write(data), reset_input_buffer() dropping input
+# that has not been read yet, and read(size, timeout) returning up to
+# `size` bytes or b'' once `timeout` seconds (by default the transport's
+# `timeout`) pass without data.
+#
+# The connection is opened on first use and kept open. An I/O error closes
+# it and raises ConnectionError; the next use reconnects, waiting
+# `reconnect_min` seconds after the first failure and doubling up to
+# `reconnect_max` while reconnecting keeps failing.
+class Transport:
+    def __init__(self, timeout, reconnect_min=1.0, reconnect_max=60.0):
+        self.timeout = timeout
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.delay = 0.0
+        self.connected = False
+        self._retry_at = 0.0
+
+    def write(self, data):
+        self._ensure_open()
+        try:
+            return self._write(data)
+        except OSError as e:
+            self._failed(e)
+
+    def read(self, size=1, timeout=None):
+        self._ensure_open()
+        try:
+            return self._read(size, self.timeout if timeout is None else timeout)
+        except OSError as e:
+            self._failed(e)
+
+    def reset_input_buffer(self):
+        if not self.connected:
+            return
+        try:
+            self._reset_input()
+        except OSError as e:
+            self._failed(e)
+
+    def close(self):
+        if self.connected:
+            self._close()
+            self.connected = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _ensure_open(self):
+        if self.connected:
+            return
+        wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            self._open()
+        except OSError as e:
+            self.delay = min(max(self.delay * 2, self.reconnect_min), self.reconnect_max)
+            self._retry_at = time.monotonic() + self.delay
+            raise ConnectionError(f"Could not connect to {self}: {e}, retrying in {self.delay} seconds") from e
+        if self.delay:
+            logging.warning(f"Reconnected to {self}")
+        self.connected = True
+        self.delay = 0.0
+
+    def _failed(self, error):
+        try:
+            self._close()
+        except OSError:
+            pass
+        self.connected = False
+        self.delay = self.reconnect_min
+        self._retry_at = time.monotonic() + self.delay
+        raise ConnectionError(f"Connection to {self} lost: {error}") from error
+
+
+# Local serial port (USB-RS485 adapter)
+class SerialTransport(Transport):
+    def __init__(self, port, baud_rate=9600, timeout=0.5, **kwargs):
+        super().__init__(timeout, **kwargs)
+        self.port = port
+        self.baud_rate = baud_rate
+        self._serial = None
+
+    def __str__(self):
+        return self.port
+
+    def _open(self):
+        self._serial = serial.Serial(self.port, self.baud_rate, timeout=self.timeout)
+
+    def _close(self):
+        self._serial.close()
+
+    def _write(self, data):
+        return self._serial.write(data)
+
+    def _reset_input(self):
+        self._serial.reset_input_buffer()
+
+    def _read(self, size, timeout):
+        # Changing the timeout reconfigures the port, so only when it differs
+        if self._serial.timeout != timeout:
+            self._serial.timeout = timeout
+        return self._serial.read(size)
+
+
+# Ethernet-RS485 gateway in raw TCP (transparent socket server) mode.
+# Gateways add network latency and buffering, so the read timeout is
+# usually set higher than for a local adapter.
+class TcpTransport(Transport):
+    def __init__(self, host, port, timeout=1.0, connect_timeout=3.0, **kwargs):
+        super().__init__(timeout, **kwargs)
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._socket = None
+
+    def __str__(self):
+        return f'tcp://{self.host}:{self.port}'
+
+    def _open(self):
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._socket.settimeout(self.timeout)
+
+    def _close(self):
+        self._socket.close()
+
+    def _write(self, data):
+        self._socket.sendall(data)
+        return len(data)
+
+    def _reset_input(self):
+        self._socket.setblocking(False)
+        try:
+            while True:
+                if not self._socket.recv(4096):
+                    raise ConnectionResetError("Connection closed by the gateway")
+        except BlockingIOError:
+            pass
+        finally:
+            self._socket.settimeout(self.timeout)
+
+    def _read(self, size, timeout):
+        self._socket.settimeout(timeout)
+        try:
+            data = self._socket.recv(size)
+        except socket.timeout:
+            return b''
+        if not data:
+            raise ConnectionResetError("Connection closed by the gateway")
+        return data
+
+
+# In-memory transport for tests: everything written is passed to
+# `respond(data)`, and whatever it returns is read back
+class LoopbackTransport(Transport):
+    def __init__(self, respond, timeout=0.1, **kwargs):
+        super().__init__(timeout, **kwargs)
+        self.respond = respond
+        self._rx = bytearray()
+
+    def __str__(self):
+        return 'loop://'
+
+    def _open(self):
+        self._rx.clear()
+
+    def _close(self):
+        pass
+
+    def _write(self, data):
+        response = self.respond(bytes(data))
+        if response:
+            self._rx += response
+        return len(data)
+
+    def _reset_input(self):
+        self._rx.clear()
+
+    def _read(self, size, timeout):
+        if not self._rx:
+            # Nothing more will arrive until the next write, so time out
+            time.sleep(timeout)
+            return b''
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+
+# Transport for a port setting: 'tcp://host:port' for a gateway, anything
+# else is a local serial port. `timeout` (and for gateways `connect_timeout`)
+# override the transport's defaults.
+def open_transport(port, baud_rate=9600, timeout=None, connect_timeout=None, **kwargs):
+    if timeout is not None:
+        kwargs['timeout'] = timeout
+    if port.startswith('tcp://'):
+        url = urlparse(port)
+        if connect_timeout is not None:
+            kwargs['connect_timeout'] = connect_timeout
+        return TcpTransport(url.hostname, url.port, **kwargs)
+    return SerialTransport(port, baud_rate, **kwargs)
@@ -0,0 +1,11 @@
+import pytest
+
+from mppt_decoder import decode_frame
+from mppt_simulator import SAMPLE_FRAME
+
+
+# Decoded simulator sample frame with some fields replaced, as in
+# reading(battery_voltage=52.0); reading() is the sample itself
+@pytest.fixture
+def reading():
+    return decode_frame(SAMPLE_FRAME)._replace
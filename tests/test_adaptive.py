@@ -0,0 +1,21 @@
+from mppt_adaptive import AdaptivePolicy
+from mppt_decoder import CHARGING_STATUS_BITS, OPERATING_STATUS_BITS, status_mask
+
+FLOATING = status_mask(CHARGING_STATUS_BITS, 'charging', 'floating_charge')
+
+
+def test_fault_bits_poll_fast(reading):
+    policy = AdaptivePolicy()
+    steady = reading(charging_status=FLOATING, pv_voltage_in=80.0)
+    assert policy.interval(1, steady) == policy.steady
+    fan = steady._replace(operating_status=status_mask(OPERATING_STATUS_BITS, 'fan_status'))
+    assert policy.interval(1, fan) == policy.fast
+
+
+def test_setup_bits_do_not_poll_fast(reading):
+    policy = AdaptivePolicy()
+    steady = reading(charging_status=FLOATING, pv_voltage_in=80.0,
+                     operating_status=status_mask(OPERATING_STATUS_BITS, 'battery_auto_identification',
+                                                  'dc_output_status', 'int_temp_probe_1_status'))
+    assert policy.interval(1, steady) == policy.steady
+    assert policy.interval(1, steady) == policy.steady
@@ -0,0 +1,49 @@
+import pytest
+
+from mppt_app import Collector
+from mppt_config import normalize_config
+
+PORT = '/dev/ttyUSB0'
+
+
+@pytest.fixture
+def collector(tmp_path):
+    config = normalize_config({
+        'ports': {PORT: {1: 'a', 2: 'b'}},
+        'fleet_state_path': str(tmp_path / 'fleet.json'),
+        'energy_report_path': None,
+        'faults': {'enabled': False},
+        'publish': {'outbox_path': str(tmp_path / 'outbox.jsonl')},
+    })
+    collector = Collector(config)
+    yield collector
+    collector.outbox.close()
+
+
+def collect(collector, cycle):
+    states = {}
+    collector.collect_cycle_states(cycle, states, collector.ports[PORT])
+    return {sensor_name: state['state'] for sensor_name, state in states.items()}
+
+
+def test_charger_counters_are_published_as_accepted(collector, reading):
+    states = collect(collector, {1: reading(power_generated_today=5.0, total_kwh_generated=100.0)})
+    assert states['sensor.a_power_generated_today'] == 5.0
+    # A glitch read of both counters changes neither sensor
+    states = collect(collector, {1: reading(power_generated_today=0.0, total_kwh_generated=0.0)})
+    assert 'sensor.a_power_generated_today' not in states
+    assert 'sensor.a_total_kwh_generated' not in states
+    states = collect(collector, {1: reading(power_generated_today=5.001, total_kwh_generated=100.001)})
+    assert states['sensor.a_power_generated_today'] == 5.001
+    assert states['sensor.a_total_kwh_generated'] == 100.001
+
+
+def test_unchanged_group_sensors_are_not_republished(collector, reading):
+    cycle = {1: reading(), 2: reading()}
+    states = collect(collector, cycle)
+    assert states['sensor.mppt_charger_combined_power'] == 612.2
+    assert 'sensor.mppt_charger_combined_total_kwh_generated' in states
+    assert not any(name.startswith('sensor.mppt_charger_combined') for name in collect(collector, cycle))
+    states = collect(collector, {1: reading(charging_current=6.0)})
+    assert list(name for name in states if name.startswith('sensor.mppt_charger_combined')) == [
+        'sensor.mppt_charger_combined_power']
@@ -0,0 +1,31 @@
+import pytest
+
+from mppt_decoder import FIELD_NAMES, decode_frame
+from mppt_simulator import SAMPLE_FRAME, SimulatedCharger
+
+np = pytest.importorskip('numpy')
+from mppt_batch import decode_frames  # noqa: E402
+
+
+def corrupted(frame):
+    frame = bytearray(frame)
+    frame[-1] ^= 0xFF
+    return bytes(frame)
+
+
+def test_columns_match_decode_frame():
+    charger = SimulatedCharger(2, seed=1)
+    frames = [SAMPLE_FRAME] + [charger.frame() for _ in range(5)]
+    frames[3] = corrupted(frames[3])
+    columns, valid = decode_frames(b''.join(frames))
+
+    assert valid.tolist() == [True, True, True, False, True, True]
+    for index, frame in enumerate(frames):
+        reading = decode_frame(frame)
+        for name in FIELD_NAMES:
+            assert columns[name][index] == getattr(reading, name), name
+
+
+def test_partial_frame_is_rejected():
+    with pytest.raises(ValueError):
+        decode_frames(SAMPLE_FRAME + SAMPLE_FRAME[:10])
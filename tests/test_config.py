@@ -0,0 +1,34 @@
+import pytest
+
+from mppt_config import normalize_config
+
+
+def test_ports_can_override_the_timeouts():
+    config = normalize_config({
+        'ports': {
+            '/dev/ttyUSB0': {'1': 'a'},
+            'tcp://10.0.0.2:4196': {'timeout': 2.0, 'connect_timeout': 10.0, 'chargers': {'1': 'b'}},
+        },
+        'timeout': 0.25,
+    })
+    assert config['ports'] == {'/dev/ttyUSB0': {1: 'a'}, 'tcp://10.0.0.2:4196': {1: 'b'}}
+    assert config['port_settings'] == {
+        '/dev/ttyUSB0': {'timeout': 0.25, 'connect_timeout': 3.0},
+        'tcp://10.0.0.2:4196': {'timeout': 2.0, 'connect_timeout': 10.0},
+    }
+
+
+def test_unknown_port_setting_is_rejected():
+    with pytest.raises(ValueError, match='ports.tcp://10.0.0.2:4196.timeuot'):
+        normalize_config({'ports': {'tcp://10.0.0.2:4196': {'timeuot': 2.0, 'chargers': {'1': 'b'}}}})
+
+
+def test_addresses_are_decimal_unless_prefixed():
+    config = normalize_config({'ports': {'/dev/ttyUSB0': {'01': 'a', '10': 'b', '0x10': 'c', 3: 'd'}}})
+    assert config['ports']['/dev/ttyUSB0'] == {1: 'a', 10: 'b', 16: 'c', 3: 'd'}
+
+
+@pytest.mark.parametrize('address', ['one', '0x', '256', '-1'])
+def test_bad_addresses_are_rejected(address):
+    with pytest.raises(ValueError, match='/dev/ttyUSB0'):
+        normalize_config({'ports': {'/dev/ttyUSB0': {address: 'a'}}})
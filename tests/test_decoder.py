@@ -0,0 +1,73 @@
+import pytest
+
+from mppt_decoder import FRAME_LENGTH, decode_frame, parse_response, status_mask
+from mppt_simulator import SAMPLE_FRAME
+
+# parse_response of the original scripts for the sample frame, except bytes
+# 44-47: the dual script already read them as today's energy, the single
+# script and query_mppt.py as a day count
+BASELINE = {
+    'mppt_address': 1,
+    'command_type': 177,
+    'control_code': 1,
+    'operating_status': {
+        'battery_auto_identification': False,
+        'battery_over_discharge_protection': False,
+        'fan_status': False,
+        'temp_status': False,
+        'dc_output_status': False,
+        'int_temp_probe_1_status': False,
+        'int_temp_probe_2_status': False,
+        'ext_temp_probe_status': False,
+    },
+    'charging_status': {
+        'charging': True,
+        'equalizing_charge': False,
+        'tracking': True,
+        'floating_charge': True,
+        'charging_current_limit': False,
+        'charging_derating': False,
+        'remote_control_prohibits_charging': False,
+        'pv_overvoltage': False,
+    },
+    'control_status': 0,
+    'battery_type': 3,
+    'battery_id_method': 4,
+    'number_of_batteries': 4,
+    'load_control_mode': 4,
+    'mppt_address_confirm': 1,
+    'baud_rate': 4,
+    'rated_voltage_level': 48.0,
+    'upper_charge_voltage': 58.0,
+    'float_voltage_limit': 57.01,
+    'low_voltage_discharge_limit': 42.0,
+    'hardware_max_charging_current_limit': 40.0,
+    'defined_charge_limit': 40.0,
+    'running_charging_current_limit': 40.0,
+    'pv_voltage_in': 113.3,
+    'battery_voltage': 52.96,
+    'charging_current': 5.78,
+    'int_temp': 31.3,
+    'ext_temp': 10.6,
+    'power_generated_today': 0.672,
+    'total_kwh_generated': 988.887,
+}
+
+
+def test_parse_response_matches_the_original_scripts():
+    data = parse_response(SAMPLE_FRAME)
+    assert data == BASELINE
+    assert list(data) == list(BASELINE)
+
+
+def test_status_bits_are_expanded_on_access():
+    reading = decode_frame(SAMPLE_FRAME)
+    assert reading.charging_status == status_mask(list(BASELINE['charging_status']), 'charging', 'tracking',
+                                                  'floating_charge')
+    assert reading.charging_flags == BASELINE['charging_status']
+    assert reading.operating_flags == BASELINE['operating_status']
+
+
+def test_short_frame_is_rejected():
+    with pytest.raises(ValueError):
+        decode_frame(SAMPLE_FRAME[:FRAME_LENGTH - 1])
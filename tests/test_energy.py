@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from mppt_energy import EnergyIntegrator
+
+# 12:00 local time, away from any day boundary
+NOON = time.mktime((2026, 6, 15, 12, 0, 0, 0, 0, -1))
+
+
+@pytest.fixture
+def sample(reading):
+    def make(power, counter_wh):
+        return reading(charging_current=power / 50, battery_voltage=50.0, total_kwh_generated=counter_wh / 1000)
+    return make
+
+
+@pytest.fixture
+def timezone(monkeypatch):
+    def use(name):
+        monkeypatch.setenv('TZ', name)
+        time.tzset()
+    yield use
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_hours_are_split_at_the_boundary(sample):
+    periods = []
+    energy = EnergyIntegrator(lambda charger, period, start, wh: periods.append((period, start, wh)))
+    # 600 W for half an hour either side of an hour boundary, sampled every
+    # minute, counter in step
+    for minute in range(61):
+        energy.update('a', sample(600.0, 10000 + 10 * minute), NOON - 1800 + 60 * minute)
+    assert periods == [('hour', NOON - 3600, pytest.approx(300.0))]
+    assert energy.hour_wh('a') == pytest.approx(300.0)
+    assert energy.today_wh('a') == pytest.approx(600.0)
+
+
+@pytest.mark.parametrize('name', ['UTC', 'Europe/Berlin', 'America/New_York', 'Asia/Kolkata',
+                                  'Australia/Adelaide'])
+def test_hours_follow_local_time(sample, timezone, name):
+    timezone(name)
+    noon = time.mktime((2026, 6, 15, 12, 0, 0, 0, 0, -1))
+    periods = []
+    energy = EnergyIntegrator(lambda charger, period, start, wh: periods.append((period, start, wh)))
+    for minute in range(0, 126, 5):
+        energy.update('a', sample(600.0, 10000 + 10 * minute), noon - 3600 + 60 * minute)
+    starts = [time.localtime(start)[3:6] for period, start, wh in periods]
+    assert starts == [(11, 0, 0), (12, 0, 0)]
+    assert [wh for period, start, wh in periods] == [pytest.approx(600.0)] * 2
+
+
+def test_irregular_samples_use_the_trapezoidal_rule(sample):
+    energy = EnergyIntegrator()
+    # Ramp from 0 to 720 W over 5 minutes, then flat for 2.5 minutes
+    for offset, power, counter_wh in ((0, 0.0, 5000), (300, 720.0, 5030), (450, 720.0, 5060)):
+        energy.update('a', sample(power, counter_wh), NOON + offset)
+    assert energy.hour_wh('a') == pytest.approx(30.0 + 30.0)
+
+
+def test_gaps_are_reconciled_with_the_counter(sample):
+    energy = EnergyIntegrator()
+    energy.update('a', sample(600.0, 10000), NOON)
+    energy.update('a', sample(600.0, 10010), NOON + 60)
+    # No samples for 20 minutes while the charger kept producing
+    energy.update('a', sample(600.0, 10210), NOON + 1260)
+    assert energy.today_wh('a') == pytest.approx(209.0)
+    energy.update('a', sample(600.0, 10220), NOON + 1320)
+    assert abs(energy.today_wh('a') - 220.0) <= 1.0
+
+
+def test_integral_is_pulled_back_to_the_counter(sample):
+    energy = EnergyIntegrator()
+    # Samples overstate the output; the counter does not move
+    for minute in range(10):
+        energy.update('a', sample(600.0, 10000), NOON + 60 * minute)
+    assert energy.today_wh('a') == pytest.approx(1.0)
+
+
+def test_bad_counter_readings_are_ignored(sample):
+    energy = EnergyIntegrator()
+    energy.update('a', sample(600.0, 10000), NOON)
+    energy.update('a', sample(600.0, 0), NOON + 60)
+    energy.update('a', sample(600.0, 9000), NOON + 120)
+    energy.update('a', sample(600.0, 10020), NOON + 180)
+    assert energy.today_wh('a') == pytest.approx(21.0)
+
+
+def test_open_periods_survive_a_restart(sample, tmp_path):
+    path = str(tmp_path / 'energy.json')
+    periods = []
+
+    def emit(charger, period, start, wh):
+        periods.append((period, start, wh))
+
+    energy = EnergyIntegrator(emit, state_path=path)
+    for minute in range(31):
+        energy.update('a', sample(600.0, 10000 + 10 * minute), NOON + 60 * minute)
+    energy.save()
+
+    energy = EnergyIntegrator(emit, state_path=path)
+    assert energy.hour_wh('a') == pytest.approx(300.0)
+    for minute in range(31, 62):
+        energy.update('a', sample(600.0, 10000 + 10 * minute), NOON + 60 * minute)
+    # The hour is reported whole, and saved again as soon as it closes
+    assert periods == [('hour', NOON, pytest.approx(600.0))]
+    assert EnergyIntegrator(state_path=path).hour_wh('a') == pytest.approx(10.0)
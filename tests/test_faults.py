@@ -0,0 +1,55 @@
+from mppt_decoder import OPERATING_STATUS_BITS
+from mppt_faults import CONDITIONS, FaultDetector
+
+
+def operating(*names):
+    return sum(1 << OPERATING_STATUS_BITS.index(name) for name in names)
+
+
+def test_fault_bits_are_debounced(reading):
+    faults = FaultDetector(debounce=3)
+    fan = reading(operating_status=operating('fan_status'))
+    assert faults.update('a', fan, 0) == []
+    assert faults.update('a', reading(), 1) == []
+    assert faults.update('a', fan, 2) == []
+    assert faults.update('a', fan, 3) == []
+    [event] = faults.update('a', fan, 4)
+    assert (event.condition, event.active) == ('fan_status', True)
+    assert faults.active('a')['fan_status']
+
+
+def test_setup_bits_are_not_faults(reading):
+    faults = FaultDetector(debounce=1)
+    healthy = reading(operating_status=operating('battery_auto_identification', 'dc_output_status',
+                                                 'ext_temp_probe_status'))
+    assert 'dc_output_status' not in CONDITIONS
+    assert faults.update('a', healthy, 0) == []
+
+
+def test_temperature_rise_at_full_polling_rate(reading):
+    faults = FaultDetector(temp_rise=2.0, min_temp_span=60.0)
+    events = []
+    # About 9 polls per second, int_temp rising 3 °C/min
+    for index in range(9 * 120):
+        timestamp = index / 9
+        events += faults.update('a', reading(int_temp=30.0 + timestamp / 20), timestamp)
+    assert [(event.condition, event.active) for event in events] == [('int_temp_rising', True)]
+    assert 60 <= events[0].time < 65
+
+
+def test_slow_temperature_change_is_not_flagged(reading):
+    faults = FaultDetector(temp_rise=2.0)
+    for index in range(9 * 300):
+        timestamp = index / 9
+        assert faults.update('a', reading(int_temp=30.0 + timestamp / 60), timestamp) == []
+
+
+def test_underperforming_within_a_peer_group(reading):
+    faults = FaultDetector(debounce=1, power_samples=1, peer_groups={'a': 'east', 'b': 'east', 'c': 'west'})
+    strong = reading(charging_current=10.0, battery_voltage=50.0, pv_voltage_in=100.0)
+    weak = strong._replace(charging_current=2.0)
+    faults.update('a', strong, 0)
+    # c is weak but has no peers of its own
+    assert faults.update('c', weak, 0) == []
+    [event] = faults.update('b', weak, 0)
+    assert (event.charger, event.condition, event.active) == ('b', 'underperforming', True)
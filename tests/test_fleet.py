@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from mppt_fleet import FleetAggregator
+
+# 12:00 local time on two consecutive days
+NOON = time.mktime((2026, 6, 15, 12, 0, 0, 0, 0, -1))
+NEXT_NOON = time.mktime((2026, 6, 16, 12, 0, 0, 0, 0, -1))
+
+
+@pytest.fixture
+def counters(reading):
+    def make(today=1.0, lifetime=100.0, current=10.0, voltage=50.0):
+        return reading(charging_current=current, battery_voltage=voltage, power_generated_today=today,
+                       total_kwh_generated=lifetime)
+    return make
+
+
+def test_group_totals(counters):
+    fleet = FleetAggregator({'bank': ['a', 'b'], 'site': ['a', 'b', 'c']})
+    fleet.update('a', counters(current=10.0, today=1.0, lifetime=100.0))
+    fleet.update('b', counters(current=5.5, today=0.5, lifetime=50.0))
+    fleet.update('c', counters(current=1.0, today=0.25, lifetime=10.0))
+    assert fleet.group_power('bank') == 775.0
+    assert fleet.group_power('site') == 825.0
+    assert fleet.group_today_kwh('bank') == 1.5
+    assert fleet.group_lifetime_kwh('site') == 160.0
+
+    # Only the change of a charger is applied
+    fleet.update('a', counters(current=0.0, today=1.25, lifetime=100.25))
+    assert fleet.group_power('bank') == 275.0
+    assert fleet.group_today_kwh('site') == 2.0
+    assert fleet.group_lifetime_kwh('site') == 160.25
+
+
+def test_lifetime_counter_never_decreases(counters):
+    fleet = FleetAggregator({'all': ['a']})
+    fleet.update('a', counters(lifetime=100.0))
+    fleet.update('a', counters(lifetime=0.0))
+    assert fleet.group_lifetime_kwh('all') == 100.0
+    fleet.update('a', counters(lifetime=99.5))
+    assert fleet.group_lifetime_kwh('all') == 100.0
+    assert fleet.lifetime_kwh('a') == 100.0
+    fleet.update('a', counters(lifetime=100.5))
+    assert fleet.group_lifetime_kwh('all') == 100.5
+
+
+def test_today_glitches_are_ignored(counters):
+    fleet = FleetAggregator({'all': ['a', 'b']})
+    fleet.update('a', counters(today=5.0), NOON)
+    fleet.update('b', counters(today=4.0), NOON)
+    for today in (0.0, 5.001, 2.5, 5.002):
+        fleet.update('a', counters(today=today), NOON)
+        assert fleet.group_today_kwh('all') >= 9.0
+        assert fleet.today_kwh('a') >= 5.0
+    assert fleet.group_today_kwh('all') == 9.002
+
+
+def test_group_resets_once_when_its_chargers_reset(counters):
+    fleet = FleetAggregator({'all': ['a', 'b']}, reset_samples=2)
+    fleet.update('a', counters(today=5.0), NOON)
+    fleet.update('b', counters(today=4.0), NOON)
+    totals = []
+    # Next morning a resets its counter first, then b
+    for charger, today in (('a', 0.0), ('a', 0.0), ('a', 0.01), ('b', 0.0), ('b', 0.0), ('a', 0.5), ('b', 0.25)):
+        fleet.update(charger, counters(today=today), NEXT_NOON)
+        totals.append(fleet.group_today_kwh('all'))
+    assert totals == [9.0, 0.0, 0.01, 0.01, 0.01, 0.5, 0.75]
+    assert (fleet.today_kwh('a'), fleet.today_kwh('b')) == (0.5, 0.25)
+
+
+def test_drop_on_a_later_day_is_a_reset(counters):
+    fleet = FleetAggregator({'all': ['a']})
+    fleet.update('a', counters(today=5.0), NOON)
+    # Not polled overnight: the first readings are already above zero
+    for today in (1.0, 1.1, 1.2):
+        fleet.update('a', counters(today=today), NEXT_NOON)
+    assert fleet.group_today_kwh('all') == 1.2
+
+
+def test_ungrouped_chargers_are_only_protected(counters):
+    fleet = FleetAggregator({'all': ['a']})
+    fleet.update('x', counters(lifetime=100.0))
+    fleet.update('x', counters(lifetime=0.0))
+    assert fleet.group_power('all') == 0.0
+    assert fleet.lifetime_kwh('x') == 100.0
+
+
+def test_counters_survive_a_restart(counters, tmp_path):
+    path = str(tmp_path / 'fleet.json')
+    fleet = FleetAggregator({'all': ['a', 'b']}, path)
+    fleet.update('a', counters(today=2.0, lifetime=100.0), NOON)
+    fleet.update('b', counters(today=1.0, lifetime=50.0), NOON)
+    for _ in range(3):
+        fleet.update('a', counters(today=0.0, lifetime=100.0), NEXT_NOON)
+    fleet.save()
+
+    fleet = FleetAggregator({'all': ['a', 'b']}, path)
+    assert fleet.group_today_kwh('all') == 0.0
+    assert fleet.group_lifetime_kwh('all') == 150.0
+    # b's reset the same day adds on instead of resetting the group again
+    for _ in range(3):
+        fleet.update('b', counters(today=0.5, lifetime=0.0), NEXT_NOON)
+    assert fleet.group_today_kwh('all') == 0.5
+    assert fleet.group_lifetime_kwh('all') == 150.0
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from mppt_history import DAY, HistoryStore
+
+NOW = time.mktime((2026, 6, 15, 12, 0, 0, 0, 0, -1))
+
+
+def test_rollups(reading):
+    history = HistoryStore()
+    start = int(NOW // 900) * 900
+    for minute, voltage in enumerate((50.0, 52.0, 54.0, 53.0)):
+        history.add('a', reading(battery_voltage=voltage), start + 60 * minute)
+    [point] = history.query('a', 'battery_voltage', start, start + 900, 900)
+    assert point == {'time': start, 'min': 50.0, 'max': 54.0, 'mean': pytest.approx(52.25), 'last': 53.0}
+    assert len(history.query('a', 'battery_voltage', start, start + 900, 60)) == 4
+    assert history.query_raw('a', 'battery_voltage', start + 60, start + 180) == [(start + 60, 52.0),
+                                                                                  (start + 120, 54.0)]
+
+
+def test_resolution_must_still_hold_the_range():
+    history = HistoryStore()
+    assert history.choose_resolution(NOW - 3600, NOW, now=NOW) == 60
+    assert history.choose_resolution(NOW - 7 * DAY, NOW, now=NOW) == 900
+    # A short range from before the 1-minute retention
+    assert history.choose_resolution(NOW - 60 * DAY, NOW - 60 * DAY + 12 * 3600, now=NOW) == 900
+    assert history.choose_resolution(NOW - 120 * DAY, NOW - 119 * DAY, now=NOW) == DAY
+
+
+def test_days_are_local_days(reading):
+    history = HistoryStore()
+    # Every hour for three days, starting at 12:00 local time
+    for hour in range(72):
+        history.add('a', reading(battery_voltage=float(hour)), NOW + 3600 * hour)
+    points = history.query('a', 'battery_voltage', NOW - DAY, NOW + 4 * DAY, DAY)
+    assert [time.localtime(point['time'])[3:6] for point in points] == [(0, 0, 0)] * 4
+    assert [(point['min'], point['max']) for point in points] == [(0.0, 11.0), (12.0, 35.0), (36.0, 59.0),
+                                                                 (60.0, 71.0)]
+
+
+def test_buckets_past_the_retention_are_overwritten(reading):
+    history = HistoryStore(rollups=((60, 600),))
+    start = int(NOW // 60) * 60
+    for minute in range(15):
+        history.add('a', reading(battery_voltage=float(minute)), start + 60 * minute)
+    points = history.query('a', 'battery_voltage', 0, start + 900, 60)
+    assert [point['last'] for point in points] == [float(minute) for minute in range(5, 15)]
+    # A late sample for a bucket that is no longer held is dropped
+    history.add('a', reading(battery_voltage=99.0), start + 60)
+    assert history.query('a', 'battery_voltage', start, start + 900, 60) == points
@@ -0,0 +1,93 @@
+import os
+
+import mppt_journal
+from mppt_journal import RECORD_SIZE, JournalReader, JournalWriter
+from mppt_simulator import SAMPLE_FRAME, SimulatedCharger
+
+START = 1_800_000_000
+
+
+def corrupted(frame):
+    frame = bytearray(frame)
+    frame[-1] ^= 0xFF
+    return bytes(frame)
+
+
+def test_time_range_is_found_by_bisect(tmp_path):
+    journal = JournalWriter(str(tmp_path), segment_seconds=60)
+    # One record every 5 s over 5 segments
+    for index in range(60):
+        journal.append(0, 1, SAMPLE_FRAME, START + 5 * index)
+    journal.close()
+    reader = JournalReader(str(tmp_path), segment_seconds=60)
+    assert len(reader.segments()) == 5
+
+    timestamps = [record[0] for record in reader.records(START + 50, START + 130)]
+    assert timestamps == [START + t for t in range(50, 130, 5)]
+    assert len(list(reader.records(START + 299))) == 0
+    assert len(list(reader.records(end=START + 1))) == 1
+
+
+def test_frames_are_re_decoded(tmp_path):
+    journal = JournalWriter(str(tmp_path))
+    journal.append(0, 1, SAMPLE_FRAME, START)
+    journal.append(0, 1, corrupted(SAMPLE_FRAME), START + 1)
+    journal.append(1, 2, SimulatedCharger(2, seed=1).frame(), START + 2)
+    journal.close()
+    decoded = list(JournalReader(str(tmp_path)).decode())
+    # The corrupt frame is kept in the journal but not decoded
+    assert [(timestamp, port, address) for timestamp, port, address, _ in decoded] == [(START, 0, 1),
+                                                                                      (START + 2, 1, 2)]
+    assert decoded[0][3].battery_voltage == 52.96
+
+
+def test_concurrent_writers_are_merged_in_time_order(tmp_path):
+    # Supervisor workers each journal their own port
+    writers = [JournalWriter(str(tmp_path), name=str(port)) for port in range(3)]
+    for index in range(50):
+        for port, writer in enumerate(writers):
+            writer.append(port, 1, SAMPLE_FRAME, START + index + port / 10)
+    for writer in writers:
+        writer.close()
+    reader = JournalReader(str(tmp_path))
+
+    timestamps = [record[0] for record in reader.records()]
+    assert len(timestamps) == 150
+    assert timestamps == sorted(timestamps)
+    records = list(reader.records(START + 1))
+    assert len(records) == 147
+    assert {record[1] for record in records} == {0, 1, 2}
+
+
+def test_bounded_range_is_found_by_segment_name(tmp_path, monkeypatch):
+    writers = [JournalWriter(str(tmp_path), segment_seconds=60, name=str(port)) for port in range(2)]
+    for index in range(100):
+        for port, writer in enumerate(writers):
+            writer.append(port, 1, SAMPLE_FRAME, START + 30 * index)
+    for writer in writers:
+        writer.close()
+    reader = JournalReader(str(tmp_path), segment_seconds=60)
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(mppt_journal.os, 'listdir', lambda path: listed.append(path) or listdir(path))
+
+    segments = reader.segments(START + 600, START + 720)
+    assert [[os.path.basename(path) for path in paths] for paths in segments] == [['0.mppt', '1.mppt']] * 2
+    # Only the two segments' own directories were listed
+    assert len(listed) == 2 and str(tmp_path) not in listed
+    assert len(list(reader.records(START + 600, START + 720))) == 8
+
+
+def test_partial_record_is_dropped_on_reopen(tmp_path):
+    journal = JournalWriter(str(tmp_path))
+    journal.append(0, 1, SAMPLE_FRAME, START)
+    journal.close()
+    [[path]] = JournalReader(str(tmp_path)).segments()
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 40)
+
+    journal = JournalWriter(str(tmp_path))
+    journal.append(0, 1, SAMPLE_FRAME, START + 1)
+    journal.close()
+    assert os.path.getsize(path) == 2 * RECORD_SIZE
+    assert [record[0] for record in JournalReader(str(tmp_path)).records()] == [START, START + 1]
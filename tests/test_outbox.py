@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import pytest
+
+from mppt_outbox import Outbox
+
+COUNTER = {'unit_of_measurement': 'kWh', 'state_class': 'total_increasing'}
+GAUGE = {'unit_of_measurement': 'V', 'state_class': 'measurement'}
+
+
+# Publisher that can be taken down; records every delivered batch
+class FakePublisher:
+    def __init__(self):
+        self.up = True
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def publish(self, states):
+        with self._lock:
+            if not self.up:
+                return list(states)
+            self.batches.append(states)
+            return []
+
+    def delivered(self, sensor_name):
+        with self._lock:
+            return [batch[sensor_name]['state'] for batch in self.batches if sensor_name in batch]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    publisher = FakePublisher()
+    outbox = Outbox(publisher, str(tmp_path / 'outbox.jsonl'), retry_min=0.01, retry_max=0.05)
+    yield outbox
+    outbox.close()
+
+
+def states(counter, voltage):
+    return {
+        'sensor.a_total_kwh_generated': {'state': counter, 'attributes': COUNTER},
+        'sensor.a_battery_voltage': {'state': voltage, 'attributes': GAUGE},
+    }
+
+
+def test_updates_are_delivered(outbox):
+    outbox.put(states(1.0, 52.0))
+    wait_for(lambda: outbox.publisher.delivered('sensor.a_battery_voltage') == [52.0])
+    assert outbox.publisher.delivered('sensor.a_total_kwh_generated') == [1.0]
+
+
+def test_outage_keeps_every_counter_and_the_latest_gauge(outbox):
+    publisher = outbox.publisher
+    publisher.up = False
+    outbox.put(states(1.0, 50.0))
+    wait_for(lambda: not outbox.healthy)
+    for index in range(2, 6):
+        outbox.put(states(float(index), 50.0 + index))
+    assert os.path.getsize(outbox.path) > 0
+    assert outbox.pending['sensor.a_battery_voltage']['state'] == 55.0
+
+    publisher.up = True
+    wait_for(lambda: outbox.healthy and not outbox.pending)
+    # Counters are replayed in order, gauges only with their latest value
+    assert publisher.delivered('sensor.a_total_kwh_generated') == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert publisher.delivered('sensor.a_battery_voltage') == [55.0]
+    wait_for(lambda: os.path.getsize(outbox.path) == 0)
+
+
+def test_backlog_is_compacted_to_the_newest_entries(tmp_path):
+    publisher = FakePublisher()
+    publisher.up = False
+    outbox = Outbox(publisher, str(tmp_path / 'outbox.jsonl'), max_backlog_bytes=2000, retry_min=0.01,
+                    retry_max=0.05)
+    try:
+        outbox.put(states(0.0, 50.0))
+        wait_for(lambda: not outbox.healthy)
+        for index in range(1, 200):
+            outbox.put(states(float(index), 50.0))
+            assert os.path.getsize(outbox.path) <= 2000 + 200
+
+        publisher.up = True
+        wait_for(lambda: outbox.healthy and os.path.getsize(outbox.path) == 0)
+        delivered = publisher.delivered('sensor.a_total_kwh_generated')
+        # The oldest entries were dropped, the rest arrive in order
+        assert delivered == sorted(delivered)
+        assert delivered[-1] == 199.0
+        assert delivered[0] > 0.0
+    finally:
+        outbox.close()
+
+
+def test_backlog_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'outbox.jsonl')
+    publisher = FakePublisher()
+    publisher.up = False
+    outbox = Outbox(publisher, path, retry_min=0.01, retry_max=0.05)
+    outbox.put(states(1.0, 50.0))
+    wait_for(lambda: not outbox.healthy)
+    outbox.put(states(2.0, 50.0))
+    outbox.close()
+    # A crash in the middle of an entry
+    with open(path, 'ab') as f:
+        f.write(b'{"time": 1')
+
+    publisher = FakePublisher()
+    outbox = Outbox(publisher, path, retry_min=0.01, retry_max=0.05)
+    try:
+        wait_for(lambda: publisher.delivered('sensor.a_total_kwh_generated') == [1.0, 2.0])
+    finally:
+        outbox.close()
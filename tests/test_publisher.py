@@ -0,0 +1,47 @@
+from mppt_publisher import ChangeFilter, Deadband
+
+
+def test_unchanged_values_wait_for_the_heartbeat():
+    changes = ChangeFilter(heartbeat=60)
+    assert changes.should_publish('sensor.a_state', 'state', 'on', now=0)
+    assert not changes.should_publish('sensor.a_state', 'state', 'on', now=59)
+    assert changes.should_publish('sensor.a_state', 'state', 'on', now=60)
+    assert changes.should_publish('sensor.a_state', 'state', 'off', now=61)
+
+
+def test_absolute_deadband():
+    changes = ChangeFilter({'battery_voltage': Deadband(absolute=0.05)})
+    assert changes.should_publish('sensor.a_battery_voltage', 'battery_voltage', 52.00, now=0)
+    assert not changes.should_publish('sensor.a_battery_voltage', 'battery_voltage', 52.04, now=1)
+    assert changes.should_publish('sensor.a_battery_voltage', 'battery_voltage', 52.06, now=2)
+    # Compared with the last published value, not the last reading
+    assert not changes.should_publish('sensor.a_battery_voltage', 'battery_voltage', 52.02, now=3)
+    assert changes.should_publish('sensor.a_battery_voltage', 'battery_voltage', 52.00, now=4)
+
+
+def test_relative_deadband():
+    changes = ChangeFilter({'charging_current': Deadband(relative=0.1)})
+    assert changes.should_publish('sensor.a_charging_current', 'charging_current', 10.0, now=0)
+    assert not changes.should_publish('sensor.a_charging_current', 'charging_current', 10.9, now=1)
+    assert changes.should_publish('sensor.a_charging_current', 'charging_current', 11.5, now=2)
+
+
+def test_relative_deadband_at_zero():
+    changes = ChangeFilter({'charging_current': Deadband(relative=0.1)})
+    assert changes.should_publish('sensor.a_charging_current', 'charging_current', 0.0, now=0)
+    assert not changes.should_publish('sensor.a_charging_current', 'charging_current', 0.0, now=1)
+    assert not changes.should_publish('sensor.a_charging_current', 'charging_current', 0, now=2)
+    assert changes.should_publish('sensor.a_charging_current', 'charging_current', 0.01, now=3)
+
+
+def test_fields_without_deadband_publish_any_change():
+    changes = ChangeFilter({'battery_voltage': Deadband(absolute=1.0)})
+    assert changes.should_publish('sensor.a_int_temp', 'int_temp', 30.0, now=0)
+    assert changes.should_publish('sensor.a_int_temp', 'int_temp', 30.1, now=1)
+
+
+def test_forget_forces_the_next_publish():
+    changes = ChangeFilter()
+    assert changes.should_publish('sensor.a_state', 'state', 1, now=0)
+    changes.forget('sensor.a_state')
+    assert changes.should_publish('sensor.a_state', 'state', 1, now=1)
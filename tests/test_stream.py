@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from mppt_decoder import FRAME_LENGTH, build_command, validate_checksum
+from mppt_metrics import FAILED_QUERIES, RETRIES
+from mppt_simulator import SAMPLE_FRAME, SimulatedCharger, Simulator
+from mppt_stream import FrameAssembler, request_frame
+from mppt_transport import LoopbackTransport
+
+
+def corrupted(frame):
+    frame = bytearray(frame)
+    frame[-1] ^= 0xFF
+    return bytes(frame)
+
+
+def test_frame_after_garbage():
+    assembler = FrameAssembler()
+    assembler.feed(b'\x00\xff\x01\x02' + SAMPLE_FRAME)
+    assert assembler.next_frame(1) == SAMPLE_FRAME
+    assert assembler.dropped_bytes == 4
+    assert assembler.next_frame(1) is None
+
+
+def test_frame_split_across_reads():
+    assembler = FrameAssembler()
+    for start in range(0, FRAME_LENGTH, 10):
+        assert assembler.next_frame(1) is None
+        assembler.feed(SAMPLE_FRAME[start:start + 10])
+    assert assembler.next_frame(1) == SAMPLE_FRAME
+
+
+def test_header_split_across_reads():
+    assembler = FrameAssembler()
+    assembler.feed(b'\x55' + SAMPLE_FRAME[:1])
+    assert assembler.next_frame(1) is None
+    # The address byte is kept until the command byte arrives
+    assembler.feed(SAMPLE_FRAME[1:])
+    assert assembler.next_frame(1) == SAMPLE_FRAME
+
+
+def test_resync_after_corrupt_frame():
+    assembler = FrameAssembler()
+    assembler.feed(corrupted(SAMPLE_FRAME) + SAMPLE_FRAME)
+    assert assembler.next_frame(1) == SAMPLE_FRAME
+    assert assembler.bad_checksums >= 1
+    assert not assembler.buffer
+
+
+def test_frames_from_other_addresses_are_dropped():
+    other = SimulatedCharger(2, seed=1).frame()
+    assembler = FrameAssembler()
+    assembler.feed(other + SAMPLE_FRAME)
+    assert assembler.next_frame(1) == SAMPLE_FRAME
+
+
+def test_request_frame_retries_after_bad_checksum():
+    responses = [corrupted(SAMPLE_FRAME), SAMPLE_FRAME]
+    transport = LoopbackTransport(lambda command: responses.pop(0), timeout=0.01)
+    retries = RETRIES.values.get(('loop://', 1), 0)
+    frame = request_frame(transport, build_command(1), FrameAssembler(), retries=2, timeout=0.05)
+    assert frame == SAMPLE_FRAME
+    assert RETRIES.values[('loop://', 1)] == retries + 1
+
+
+def test_request_frame_times_out_without_response():
+    transport = LoopbackTransport(Simulator([2]).respond, timeout=0.01)
+    failed = FAILED_QUERIES.values.get(('loop://', 1), 0)
+    with pytest.raises(TimeoutError):
+        request_frame(transport, build_command(1), FrameAssembler(), retries=2, timeout=0.02)
+    assert FAILED_QUERIES.values[('loop://', 1)] == failed + 1
+
+
+def test_request_frame_on_a_lossy_bus():
+    simulator = Simulator([1, 2, 3], drop_rate=0.2, corrupt_rate=0.2, seed=7)
+    transport = LoopbackTransport(simulator.respond, timeout=0.005)
+    assembler = FrameAssembler()
+    received = 0
+    for query in range(60):
+        address = 1 + query % 3
+        try:
+            frame = request_frame(transport, build_command(address), assembler, retries=3, timeout=0.02)
+        except TimeoutError:
+            continue
+        assert frame[0] == address
+        assert validate_checksum(frame)
+        received += 1
+    assert received >= 55
+
+
+def test_late_reply_is_not_taken_by_the_next_poll():
+    fresh = SimulatedCharger(1, seed=1).frame()
+    responses = [None, fresh, fresh]
+    transport = LoopbackTransport(lambda command: responses.pop(0), timeout=0.01)
+    assembler = FrameAssembler()
+    with pytest.raises(TimeoutError):
+        request_frame(transport, build_command(1), assembler, retries=1, timeout=0.02)
+    # The reply to the failed query arrives after its deadline, partly
+    # already read
+    assembler.feed(SAMPLE_FRAME[:40])
+    transport._rx += SAMPLE_FRAME[40:]
+    for _ in range(2):
+        assert request_frame(transport, build_command(1), assembler, retries=1, timeout=0.02) == fresh
+
+
+def test_reads_stop_at_the_deadline():
+    transport = LoopbackTransport(lambda command: None, timeout=1.0)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        request_frame(transport, build_command(1), FrameAssembler(), retries=2, timeout=0.05)
+    assert time.monotonic() - start < 0.5
@@ -0,0 +1,28 @@
+import threading
+
+import pytest
+
+from mppt_simulator import Simulator, start_pty
+from mppt_supervisor import _CONTEXT, Supervisor
+
+pytest.importorskip('serial')
+
+
+def test_start_method_is_not_fork():
+    assert _CONTEXT.get_start_method() in ('forkserver', 'spawn')
+
+
+def test_worker_cycles_reach_the_publisher():
+    path = start_pty(Simulator([1, 2], seed=1), pace=False)
+    cycles = []
+    received = threading.Event()
+
+    def publish(port, cycle):
+        cycles.append((port, sorted(cycle)))
+        received.set()
+
+    supervisor = Supervisor({path: [1, 2]}, 9600, publish, adaptive=False)
+    # Publishing runs on its own thread, so stop once a cycle has arrived
+    threading.Thread(target=lambda: received.wait(30) and supervisor.stop(), daemon=True).start()
+    supervisor.run()
+    assert cycles[0] == (path, [1, 2])
@@ -0,0 +1,121 @@
+import socket
+import threading
+
+import pytest
+
+from mppt_decoder import build_command
+from mppt_simulator import Simulator
+from mppt_stream import FrameAssembler, request_frame
+from mppt_transport import LoopbackTransport, SerialTransport, TcpTransport, open_transport
+
+
+# Raw TCP server answering like an Ethernet-RS485 gateway with simulated
+# chargers behind it; yields (port, accepted connections)
+@pytest.fixture
+def gateway():
+    simulator = Simulator([1, 2])
+    server = socket.create_server(('127.0.0.1', 0))
+    connections = []
+
+    def handle(conn):
+        buffer = bytearray()
+        with conn:
+            while True:
+                try:
+                    data = conn.recv(256)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                for command in simulator.commands(buffer):
+                    response = simulator.respond(command)
+                    if response:
+                        conn.sendall(response)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            connections.append(conn)
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield server.getsockname()[1], connections
+    server.close()
+
+
+def test_open_transport_by_port_setting():
+    transport = open_transport('tcp://127.0.0.1:4196', timeout=2.0)
+    assert isinstance(transport, TcpTransport)
+    assert (transport.host, transport.port, transport.timeout) == ('127.0.0.1', 4196, 2.0)
+    assert str(transport) == 'tcp://127.0.0.1:4196'
+    transport = open_transport('tcp://127.0.0.1:4196', connect_timeout=10.0)
+    assert transport.connect_timeout == 10.0
+    # Serial ports have no connect timeout
+    transport = open_transport('/dev/ttyUSB0', 19200, connect_timeout=10.0)
+    assert isinstance(transport, SerialTransport)
+    # Nothing is opened before first use
+    assert not transport.connected
+
+
+def test_loopback_read_times_out():
+    transport = LoopbackTransport(lambda command: b'reply', timeout=0.01)
+    assert transport.read(10) == b''
+    transport.write(b'query')
+    assert transport.read(3) == b'rep'
+    assert transport.read(10) == b'ly'
+    assert transport.read(10) == b''
+
+
+def test_loopback_error_reconnects():
+    def respond(command):
+        raise OSError("adapter unplugged")
+
+    transport = LoopbackTransport(respond, timeout=0.01, reconnect_min=0.01)
+    with pytest.raises(ConnectionError):
+        transport.write(b'query')
+    assert not transport.connected
+    transport.respond = lambda command: b'ok'
+    transport.write(b'query')
+    assert transport.connected
+    assert transport.read(2) == b'ok'
+
+
+def test_tcp_gateway_round_trip(gateway):
+    port, connections = gateway
+    with TcpTransport('127.0.0.1', port, timeout=0.2) as transport:
+        assembler = FrameAssembler()
+        for address in (1, 2, 1):
+            frame = request_frame(transport, build_command(address), assembler, retries=2, timeout=0.5)
+            assert frame[0] == address
+    # One connection is reused for every query
+    assert len(connections) == 1
+
+
+def test_tcp_gateway_reconnects_after_drop(gateway):
+    port, connections = gateway
+    with TcpTransport('127.0.0.1', port, timeout=0.2, reconnect_min=0.01) as transport:
+        assembler = FrameAssembler()
+        request_frame(transport, build_command(1), assembler, retries=1, timeout=0.5)
+        connections[0].shutdown(socket.SHUT_RDWR)
+        with pytest.raises(ConnectionError):
+            request_frame(transport, build_command(1), assembler, retries=1, timeout=0.5)
+        frame = request_frame(transport, build_command(2), assembler, retries=1, timeout=0.5)
+        assert frame[0] == 2
+    assert len(connections) == 2
+
+
+def test_connect_backoff_doubles():
+    server = socket.create_server(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    server.close()
+    transport = TcpTransport('127.0.0.1', port, reconnect_min=0.01, reconnect_max=0.03)
+    delays = []
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            transport.write(b'query')
+        delays.append(transport.delay)
+    assert delays == [0.01, 0.02, 0.03, 0.03]